@@ -0,0 +1,137 @@
+from .errors import PayloadTooLargeError, UnsupportedMediaTypeError, \
+    ValidationError
+
+# Default limit of JSON body and of a single NDJSON record in bytes.
+MAX_BODY_SIZE = 10 * 1024 * 1024
+
+NDJSON_CONTENT_TYPES = ('application/x-ndjson', 'application/ndjson')
+
+_loads = None
+
+
+def json_loads(data):
+    """
+    Decodes JSON by the fastest available decoder: ujson, simplejson (with
+    C speedups) or json. The decoder is chosen on first call.
+    """
+    global _loads
+    if _loads is None:
+        try:
+            from ujson import loads as _loads
+        except ImportError:
+            try:
+                from simplejson import loads as _loads
+            except ImportError:
+                from json import loads as _loads
+    return _loads(data)
+
+
+class JsonBody(object):
+    """
+    Lazy decoder of JSON and NDJSON (newline delimited JSON) request
+    bodies. Nothing is read until "data" is accessed or records are
+    iterated:
+
+        def create_products(request):
+            for product in request.json_body:
+                ...
+
+    "Max_size" limits JSON body and every NDJSON record. "Max_stream_size"
+    limits the whole NDJSON body (unlimited by default), records are read
+    and decoded one by one, so huge uploads never sit in memory.
+    Only bodies of "application/json" (or "+json") and NDJSON content types
+    are decoded, others raise UnsupportedMediaTypeError.
+    """
+    def __init__(self, request, max_size=MAX_BODY_SIZE, max_stream_size=None):
+        self._request = request
+        self.max_size = max_size
+        self.max_stream_size = max_stream_size
+        self._is_loaded = False
+        self._data = None
+
+    @property
+    def content_type(self):
+        return self._request.environ.get('CONTENT_TYPE', '') \
+            .split(';')[0].strip().lower()
+
+    @property
+    def content_length(self):
+        try:
+            return int(self._request.environ.get('CONTENT_LENGTH') or 0)
+        except ValueError:
+            return 0
+
+    @property
+    def data(self):
+        """
+        Decoded JSON body or None if body is empty.
+        """
+        if not self._is_loaded:
+            if not self._is_json(self.content_type):
+                self._check_content_type()
+                self._is_loaded = True
+                return None
+            # Check declared size before reading.
+            self._check_size(self.content_length, self.max_size)
+            raw = self._stream().read(self.max_size + 1)
+            self._check_size(len(raw), self.max_size)
+            self._data = _decode(raw) if raw.strip() else None
+            self._is_loaded = True
+        return self._data
+
+    def __iter__(self):
+        """
+        Yields decoded records of NDJSON body one by one.
+        """
+        if self.content_type not in NDJSON_CONTENT_TYPES:
+            self._check_content_type()
+            return
+        self._check_size(self.content_length, self.max_stream_size)
+        stream = self._stream()
+        total = 0
+        while True:
+            line = stream.readline(self.max_size + 1)
+            if not line:
+                break
+            if len(line) > self.max_size and not line.endswith('\n'):
+                raise PayloadTooLargeError(
+                    'NDJSON record is larger than %d bytes' % self.max_size
+                )
+            total += len(line)
+            self._check_size(total, self.max_stream_size)
+            if line.strip():
+                yield _decode(line)
+
+    def _stream(self):
+        # Werkzeug's request has "stream", Django's request is file-like.
+        return getattr(self._request, 'stream', self._request)
+
+    @staticmethod
+    def _is_json(content_type):
+        return content_type == 'application/json' or \
+            content_type.endswith('+json')
+
+    def _check_content_type(self):
+        # Body of other content type (e.g. a form) isn't JSON, but requests
+        # without body are fine.
+        if self.content_length:
+            raise UnsupportedMediaTypeError(
+                'Request body of "%s" content type is not supported' %
+                self.content_type
+            )
+
+    @staticmethod
+    def _check_size(size, max_size):
+        if max_size is not None and size > max_size:
+            raise PayloadTooLargeError(
+                'Request body is larger than %d bytes' % max_size
+            )
+
+
+def _decode(data):
+    try:
+        return json_loads(data)
+    except ValueError:
+        raise ValidationError(
+            'Request body must be a valid JSON', key='body', code='json'
+        )
@@ -0,0 +1,91 @@
+from collections import OrderedDict
+from threading import Event, Lock
+from time import time
+
+
+class LocalCache(object):
+    """
+    Thread safe in-process cache with TTL and LRU eviction. Used as a fast
+    tier in front of a shared cache, so it has an interface similar to
+    Django's cache (get, set, delete, clear).
+    """
+    def __init__(self, max_size=10000, ttl=60):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self._lock = Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            try:
+                expires, value = self._data.pop(key)
+            except KeyError:
+                return default
+            if expires < time():
+                return default
+            # Move the key to the end to keep LRU order.
+            self._data[key] = (expires, value)
+            return value
+
+    def set(self, key, value, ttl=None):
+        expires = time() + (self.ttl if ttl is None else ttl)
+        with self._lock:
+            self._data.pop(key, None)
+            self._data[key] = (expires, value)
+            while len(self._data) > self.max_size:
+                self._data.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+
+class _Call(object):
+    def __init__(self):
+        self.event = Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight(object):
+    """
+    Collapses concurrent calls with the same key into a single call: the
+    first caller runs the function, the others wait for its result (or
+    exception) instead of doing the same work again. If "timeout" is
+    specified, a waiting caller runs the function itself after "timeout"
+    seconds.
+    """
+    def __init__(self, timeout=None):
+        self.timeout = timeout
+        self._calls = {}
+        self._lock = Lock()
+
+    def do(self, key, func, *args, **kwargs):
+        with self._lock:
+            call = self._calls.get(key)
+            is_leader = call is None
+            if is_leader:
+                call = self._calls[key] = _Call()
+        if not is_leader:
+            if not call.event.wait(self.timeout):
+                return func(*args, **kwargs)
+            if call.error is not None:
+                raise call.error
+            return call.result
+        try:
+            call.result = func(*args, **kwargs)
+        except Exception as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.event.set()
+        return call.result
@@ -20,3 +20,17 @@ class MultipleChoicesError(Exception):
     def __init__(self, msg, body):
         super(MultipleChoicesError, self).__init__(msg)
         self.body = body
+
+
+class OverloadError(Exception):
+    def __init__(self, msg, retry_after=1):
+        super(OverloadError, self).__init__(msg)
+        self.retry_after = retry_after
+
+
+class PayloadTooLargeError(Exception):
+    pass
+
+
+class UnsupportedMediaTypeError(Exception):
+    pass
@@ -1,15 +1,40 @@
+from array import array
 from contextlib import nested
+from copy import copy
+from csv import excel, reader as csv_reader
+from itertools import islice, izip
+from json import loads
 from logging import getLogger
+from mmap import mmap, ACCESS_READ
+import os
+import sys
+from tempfile import mkstemp
 from time import time
+from zlib import compressobj, DEFLATED, MAX_WBITS
 
-from .serializers import to_json, to_xml, inflector
-from csv import excel
-free_up_memory = __import__(
-    'utils.cli', fromlist=('free_up_memory',)
-).free_up_memory
+from .serializers import is_ndarray, singular_noun, to_json, to_xml
 
 
 _logger = getLogger('api.export')
+_free_up_memory = None
+
+
+def free_up_memory():
+    """
+    Frees memory between exported batches by "utils.cli.free_up_memory" of
+    application if it exists or by garbage collection otherwise. It's
+    imported on first call to keep import of the module cheap.
+    """
+    global _free_up_memory
+    if _free_up_memory is None:
+        try:
+            _free_up_memory = __import__(
+                'utils.cli', fromlist=('free_up_memory',)
+            ).free_up_memory
+        except (ImportError, AttributeError):
+            from gc import collect
+            _free_up_memory = collect
+    _free_up_memory()
 
 
 class Exporter(object):
@@ -18,8 +43,13 @@ class Exporter(object):
     _counters = None
     FLUSH_AT = 1000
 
-    def add_file(self, filename, file_format, mapper=None, lang=None):
-        assert file_format in ('xml', 'json', 'jsono', 'csv')
+    def add_file(self, filename, file_format, mapper=None, lang=None,
+                 fileobj=None):
+        """
+        Adds output file. Already opened file-like object can be passed as
+        "fileobj" (then "filename" is used as its name only).
+        """
+        assert file_format in ('xml', 'json', 'jsono', 'ndjson', 'csv')
         if self.files is None:
             self.files = []
         self.files.append({
@@ -27,6 +57,7 @@ class Exporter(object):
             'format': file_format,
             'lang': lang,
             'mapper': mapper,
+            'fileobj': fileobj,
         })
 
     def __enter__(self):
@@ -34,8 +65,8 @@ class Exporter(object):
         for f in self.files:
             f['serialize'] = getattr(self, 'serialize_' + f['format'])
             if not f['mapper']:
-                f['mapper'] = lambda entity: entity
-            f['file'] = open(f['name'], 'w')
+                f['mapper'] = lambda lang, entity: entity
+            f['file'] = f.get('fileobj') or open(f['name'], 'w')
             if hasattr(self, f['format'] + '_prefix'):
                 f['file'].write(
                     getattr(self, f['format'] + '_prefix')(f['lang'])
@@ -78,7 +109,7 @@ class Exporter(object):
     def serialize_xml(self, obj):
         return to_xml(
             obj,
-            inflector.singular_noun(self.xml_root_node) or 'entity',
+            singular_noun(self.xml_root_node) or 'entity',
             inc_header=False
         )
 
@@ -94,76 +125,633 @@ class Exporter(object):
     def serialize_jsono(self, obj):
         return (',' if self._counter else '') + to_json(obj) + '\n'
 
+    def serialize_ndjson(self, obj):
+        return to_json(obj) + '\n'
+
     def serialize_csv(self, obj):
+        if is_ndarray(obj):
+            if not len(obj):
+                return ''
+            # Format NumPy array by columns. Numbers and booleans never
+            # contain quotes, so they are only wrapped by them.
+            columns = []
+            for field in self.csv_fields_order:
+                column = obj[field]
+                if column.dtype.kind in 'biuf':
+                    columns.append([
+                        _CSV_NUMBER % value for value in column.tolist()
+                    ])
+                else:
+                    columns.append([
+                        _csv_value(value) for value in column.tolist()
+                    ])
+            return (excel.lineterminator if self._counter else '') + \
+                excel.lineterminator.join(
+                    excel.delimiter.join(row) for row in izip(*columns)
+                )
         return (excel.lineterminator if self._counter else '') + \
             excel.delimiter.join([
-                excel.quotechar +
-                unicode(obj[field]).encode('utf-8').replace(
-                    excel.quotechar,
-                    excel.quotechar + excel.quotechar
-                ) + excel.quotechar
-                for field in self.csv_fields_order
+                _csv_value(obj[field]) for field in self.csv_fields_order
             ])
 
 
-class DjangoModelExport(object):
-    def __init__(self, model, batch_size=1000):
-        pass
+_CSV_NUMBER = excel.quotechar + '%s' + excel.quotechar
 
 
-def export_django_model(outputs, model, batch_size=1000, fields=None,
-                        logger=None, limit=None, **filters):
+def _csv_value(value):
+    return excel.quotechar + unicode(value).encode('utf-8').replace(
+        excel.quotechar, excel.quotechar + excel.quotechar
+    ) + excel.quotechar
+
+
+class ExportReader(object):
     """
-    Export Django model's data iteratively by "batch_size" pieces.
-    "Outputs" is array of Exporter-based objects provide "export_entity"
-    method. "Fields" are list of model's fields to export. By default
-    all fields will be exported.
+    Random access reader of "jsono", "ndjson" and "csv" exports made by
+    Exporter. The file is memory-mapped and an index of records' offsets
+    is built by a single pass (or loaded from "<filename>.idx" sidecar
+    file if it is still actual), so getting of N-th record or a slice of
+    records doesn't load the whole file into memory:
+
+        with ExportReader('products.jsono') as products:
+            page = products[100:120]
+    """
+    INDEX_SUFFIX = '.idx'
+    # Header of index file: size and mtime of indexed file.
+    _INDEX_HEADER = 2
+
+    def __init__(self, filename, file_format=None, persist_index=True):
+        if file_format is None:
+            file_format = os.path.splitext(filename)[1].lstrip('.')
+        assert file_format in ('jsono', 'ndjson', 'csv'), \
+            'Unsupported format "%s"' % file_format
+        self.filename = filename
+        self.format = file_format
+        self._file = open(filename, 'rb')
+        stat = os.fstat(self._file.fileno())
+        self._stamp = (stat.st_size, int(stat.st_mtime))
+        # mmap can't map an empty file.
+        self._mm = mmap(self._file.fileno(), 0, access=ACCESS_READ) \
+            if stat.st_size else ''
+        self.offsets = self._load_index()
+        if self.offsets is None:
+            self.offsets = self._build_index()
+            if persist_index:
+                self._save_index()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *excinfo):
+        self.close()
+
+    def close(self):
+        if self._mm:
+            self._mm.close()
+        self._file.close()
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getitem__(self, item):
+        if isinstance(item, slice):
+            return [self._decode(i) for i in xrange(*item.indices(len(self)))]
+        if item < 0:
+            item += len(self)
+        if not 0 <= item < len(self):
+            raise IndexError('Record index out of range')
+        return self._decode(item)
+
+    def __iter__(self):
+        for i in xrange(len(self)):
+            yield self._decode(i)
+
+    def raw(self, num):
+        """
+        Returns N-th record as is (without decoding).
+        """
+        return _strip_record(
+            self.format, self._mm[self.offsets[num]:self.offsets[num + 1]]
+        )
+
+    def _decode(self, num):
+        return _decode_record(self.format, self.raw(num))
+
+    def chunks(self, chunk_size):
+        """
+        Yields (start, stop) ranges of records by "chunk_size" pieces.
+        """
+        for start in xrange(0, len(self), chunk_size):
+            yield start, min(start + chunk_size, len(self))
+
+    def map_chunks(self, func, chunk_size=10000, processes=None):
+        """
+        Applies "func" to every record in parallel processes and yields
+        results in order of records. Every process maps the file itself, so
+        only offsets are sent to workers. "Func" must be picklable (e.g.
+        defined at module level).
+        """
+        tasks = (
+            (self.filename, self.format, func,
+             self.offsets[start:stop + 1].tostring())
+            for start, stop in self.chunks(chunk_size)
+        )
+        from multiprocessing import Pool
+
+        pool = Pool(processes)
+        try:
+            for results in pool.imap(_map_chunk, tasks):
+                for result in results:
+                    yield result
+        finally:
+            pool.terminate()
+
+    def _build_index(self):
+        mm = self._mm
+        size = len(mm)
+        offsets = array('L')
+        pos = 0
+        if self.format == 'jsono':
+            # Skip opening "[" line.
+            pos = mm.find('\n') + 1 if size else 0
+        quotes = 0
+        while pos < size:
+            end = mm.find('\n', pos)
+            end = size if end == -1 else end + 1
+            if self.format == 'csv':
+                # Quoted values can contain line breaks, so a record ends
+                # only when all its quotes are closed.
+                if not quotes:
+                    offsets.append(pos)
+                quotes += mm[pos:end].count(excel.quotechar)
+                quotes %= 2
+            else:
+                line = mm[pos:end].strip()
+                if self.format == 'jsono' and line == ']':
+                    break
+                # Blank lines aren't records.
+                if line:
+                    offsets.append(pos)
+            pos = end
+        offsets.append(pos)
+        return offsets
+
+    def _index_filename(self):
+        return self.filename + self.INDEX_SUFFIX
+
+    def _load_index(self):
+        try:
+            with open(self._index_filename(), 'rb') as f:
+                data = array('L')
+                data.fromstring(f.read())
+        except (IOError, ValueError):
+            # ValueError is raised for partially written file.
+            return None
+        if tuple(data[:self._INDEX_HEADER]) != self._stamp:
+            return None
+        offsets = data[self._INDEX_HEADER:]
+        if not self._is_index_complete(offsets):
+            return None
+        return offsets
+
+    def _is_index_complete(self, offsets):
+        """
+        Checks that index isn't truncated: its last offset is the end of
+        file (or of "]" line of "jsono" file).
+        """
+        if not offsets:
+            return False
+        end = offsets[-1]
+        if self.format == 'jsono':
+            return end <= len(self._mm) and \
+                self._mm[end:].strip() in ('', ']')
+        return end == len(self._mm)
+
+    def _save_index(self):
+        data = array('L', self._stamp)
+        data.extend(self.offsets)
+        filename = self._index_filename()
+        # Index is written to a temporary file renamed then, so concurrent
+        # readers never see a partially written index.
+        try:
+            fd, tmp_filename = mkstemp(
+                prefix=os.path.basename(filename) + '.',
+                dir=os.path.dirname(filename) or '.'
+            )
+        except (IOError, OSError) as e:
+            _logger.warning('Cannot save index of %s: %s' % (
+                self.filename, e
+            ))
+            return
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                data.tofile(f)
+            # mkstemp creates files readable by owner only.
+            os.chmod(tmp_filename, 0644)
+            os.rename(tmp_filename, filename)
+        except (IOError, OSError) as e:
+            _logger.warning('Cannot save index of %s: %s' % (
+                self.filename, e
+            ))
+            try:
+                os.unlink(tmp_filename)
+            except OSError:
+                pass
+
+
+def _strip_record(file_format, data):
+    data = data.rstrip('\r\n')
+    if file_format == 'jsono':
+        # Records except the first one are prefixed by ",".
+        return data.lstrip(',')
+    return data
+
+
+def _decode_record(file_format, data):
+    if file_format == 'csv':
+        return [
+            value.decode('utf-8')
+            for value in next(csv_reader(data.splitlines(True), excel))
+        ]
+    return loads(data)
+
+
+def _map_chunk(task):
+    filename, file_format, func, offsets_str = task
+    offsets = array('L')
+    offsets.fromstring(offsets_str)
+    with open(filename, 'rb') as f:
+        mm = mmap(f.fileno(), 0, access=ACCESS_READ)
+        try:
+            return [
+                func(_decode_record(
+                    file_format,
+                    _strip_record(
+                        file_format, mm[offsets[i]:offsets[i + 1]]
+                    )
+                ))
+                for i in xrange(len(offsets) - 1)
+            ]
+        finally:
+            mm.close()
+
+
+class RowSource(object):
+    """
+    Base class of rows' sources for exporting. A source yields rows by
+    batches of "batch_size" pieces, every row is passed to
+    "export_entity" method of outputs as is.
+    """
+    batch_size = 1000
+
+    def __init__(self, batch_size=None):
+        if batch_size is not None:
+            self.batch_size = batch_size
+
+    def batches(self):
+        """
+        Yields rows by sequences of at most "batch_size" rows. Abstract,
+        must be implemented by child classes.
+        """
+        raise NotImplementedError(
+            '%s must implement "batches"' % self.__class__.__name__
+        )
+
+    def __iter__(self):
+        for batch in self.batches():
+            for row in batch:
+                yield row
+
+    def __unicode__(self):
+        return self.__class__.__name__
+
+    def __str__(self):
+        return unicode(self).encode('utf-8')
+
+
+class IterableSource(RowSource):
+    """
+    Source of rows from any iterable (e.g. generator or list of dicts).
+    """
+    def __init__(self, iterable, batch_size=None):
+        super(IterableSource, self).__init__(batch_size)
+        self.iterable = iterable
+
+    def batches(self):
+        rows = iter(self.iterable)
+        while True:
+            batch = tuple(islice(rows, self.batch_size))
+            if not batch:
+                break
+            yield batch
+
+
+class CursorSource(RowSource):
+    """
+    Source of rows from DB-API 2.0 cursor with already executed query.
+    Rows are fetched by "fetchmany", so server-side (named) cursors never
+    load the whole result into memory. If "as_dict" is true, rows are
+    converted to dicts by column names from "cursor.description".
+    """
+    def __init__(self, cursor, batch_size=None, as_dict=True):
+        super(CursorSource, self).__init__(batch_size)
+        self.cursor = cursor
+        self.as_dict = as_dict
+
+    def batches(self):
+        cursor = self.cursor
+        cursor.arraysize = self.batch_size
+        columns = None
+        if self.as_dict:
+            columns = tuple(col[0] for col in cursor.description)
+        while True:
+            rows = cursor.fetchmany(self.batch_size)
+            if not rows:
+                break
+            if columns is not None:
+                rows = tuple(dict(zip(columns, row)) for row in rows)
+            yield rows
+
+    def __unicode__(self):
+        return u'cursor'
+
+
+class QuerySetSource(RowSource):
+    """
+    Source of rows from Django's queryset evaluated by single query through
+    "iterator", which uses server-side cursors where a database supports
+    them (PostgreSQL), so querysets of any size are exported without
+    repeated queries.
+    """
+    def __init__(self, qs, batch_size=None):
+        super(QuerySetSource, self).__init__(batch_size)
+        self.qs = qs
+
+    def _iterator(self):
+        try:
+            return self.qs.iterator(chunk_size=self.batch_size)
+        except TypeError:
+            # Django < 2.0 doesn't support "chunk_size".
+            return self.qs.iterator()
+
+    def batches(self):
+        rows = self._iterator()
+        while True:
+            batch = tuple(islice(rows, self.batch_size))
+            if not batch:
+                break
+            yield batch
+
+    def __unicode__(self):
+        return self.qs.model.__name__
+
+
+class KeysetQuerySetSource(QuerySetSource):
+    """
+    Source of rows from Django's queryset fetched by "pk__gt" pieces.
+    Use it when a long living cursor isn't acceptable (e.g. with
+    transaction pooling in pgbouncer). Queryset's rows must be model
+    instances or dicts containing "pk_field" key (model's primary key by
+    default), ValueError is raised otherwise.
+    """
+    def __init__(self, qs, batch_size=None, pk_field=None):
+        super(KeysetQuerySetSource, self).__init__(
+            qs.order_by('pk'), batch_size
+        )
+        fields = getattr(qs, '_fields', None)
+        if pk_field is None:
+            pk_field = 'pk' if fields and 'pk' in fields else \
+                qs.model._meta.pk.attname
+        self.pk_field = pk_field
+        iterable = getattr(qs, '_iterable_class', None)
+        if iterable is not None:
+            from django.db.models.query import ModelIterable, ValuesIterable
+
+            if not issubclass(iterable, (ModelIterable, ValuesIterable)):
+                raise ValueError(
+                    'Rows of %s must be dicts or model instances' % self
+                )
+            if issubclass(iterable, ValuesIterable) and fields and \
+                    pk_field not in fields:
+                raise ValueError('"%s" must be selected from %s' % (
+                    pk_field, self
+                ))
+
+    def batches(self):
+        last_id = None
+        while True:
+            if last_id is not None:
+                qs = self.qs.filter(pk__gt=last_id)
+            else:
+                qs = self.qs
+            batch = tuple(qs[:self.batch_size])
+            if not batch:
+                break
+            yield batch
+            last = batch[-1]
+            if isinstance(last, dict):
+                last_id = last[self.pk_field]
+            else:
+                last_id = getattr(last, self.pk_field)
+
+
+class DjangoModelExport(QuerySetSource):
+    """
+    Source of Django model's rows as dicts. "Fields" are list of model's
+    fields to export, by default all fields will be exported.
+    """
+    def __init__(self, model, batch_size=None, fields=None, **filters):
+        qs = model.objects.order_by('pk')
+        if filters:
+            qs = qs.filter(**filters)
+        if fields is None:
+            qs = qs.values()
+        else:
+            qs = qs.values(*fields)
+        super(DjangoModelExport, self).__init__(qs, batch_size)
+
+
+def export_source(outputs, source, logger=None, limit=None):
+    """
+    Exports rows of "source" (RowSource instance or any iterable) to all
+    "outputs" by batches. "Outputs" is array of Exporter-based objects
+    provide "export_entity" method. Returns number of exported rows.
     """
     if logger is None:
         logger = _logger
     if not hasattr(outputs, '__iter__'):
         outputs = (outputs, )
-    qs = model.objects.order_by('pk')
-    if filters:
-        qs = qs.filter(**filters)
-    if fields is None:
-        qs = qs.values()
-    else:
-        qs = qs.values(*fields)
+    if not isinstance(source, RowSource):
+        source = IterableSource(source)
     cnt_all = 0
 
-    logger.info('Started exporting of %s' % model.__name__)
+    logger.info('Started exporting of %s' % source)
     _start = time()
     with nested(*outputs):
         batch_num = 0
-        last_id = None
-        while True:
-            start = time()
-            if limit and cnt_all >= limit:
-                break
+        start = time()
+        for chunk in source.batches():
+            if limit and cnt_all + len(chunk) > limit:
+                chunk = chunk[:limit - cnt_all]
             batch_num += 1
-            if limit and batch_num * batch_size > limit:
-                batch_size = limit - (batch_num - 1) * batch_size
-            cnt_batch = 0
-            if last_id is not None:
-                chunk = tuple(qs.filter(pk__gt=last_id)[:batch_size])
-            else:
-                chunk = tuple(qs[:batch_size])
-            if not len(chunk):
-                break
             for entity in chunk:
                 for output in outputs:
                     output.export_entity(entity)
-                    cnt_all += 1
-            last_id = chunk[-1]['id']
-            cnt_batch += 1
+            cnt_all += len(chunk)
             logger.info(
                 'Batch %d has been processed (%d entities) in %0.3f sec' % (
                     batch_num, len(chunk), time() - start
                 )
             )
             free_up_memory()
+            if limit and cnt_all >= limit:
+                break
+            start = time()
     logger.info('Done in %0.3f sec' % (time() - _start))
+    return cnt_all
+
+
+def export_django_model(outputs, model, batch_size=1000, fields=None,
+                        logger=None, limit=None, **filters):
+    """
+    Export Django model's data iteratively by "batch_size" pieces.
+    "Outputs" is array of Exporter-based objects provide "export_entity"
+    method. "Fields" are list of model's fields to export. By default
+    all fields will be exported.
+    """
+    qs = model.objects.all()
+    if filters:
+        qs = qs.filter(**filters)
+    if fields is None:
+        qs = qs.values()
+    else:
+        qs = qs.values(*fields)
+    source = KeysetQuerySetSource(qs, batch_size)
+    return export_source(outputs, source, logger, limit)
+
+
+# MIME types of streamed exports.
+EXPORT_MIME_TYPES = {
+    'xml': 'application/xml',
+    'json': 'application/json',
+    'jsono': 'application/json',
+    'ndjson': 'application/x-ndjson',
+    'csv': 'text/csv',
+}
+
+
+class _StreamBuffer(object):
+    """
+    File-like object collecting written data (optionally gzipped) until it
+    is drained.
+    """
+    def __init__(self, compress=False):
+        self._chunks = []
+        self._compressor = None
+        if compress:
+            self._compressor = compressobj(6, DEFLATED, MAX_WBITS | 16)
+
+    def write(self, data):
+        if isinstance(data, unicode):
+            data = data.encode('utf-8')
+        if self._compressor is not None:
+            data = self._compressor.compress(data)
+        if data:
+            self._chunks.append(data)
+
+    def flush(self):
+        pass
+
+    def drain(self, is_last=False):
+        if is_last and self._compressor is not None:
+            self._chunks.append(self._compressor.flush())
+        data = ''.join(self._chunks)
+        self._chunks = []
+        return data
+
+
+def iter_export(source, file_format, exporter=None, mapper=None, lang=None,
+                compress=False):
+    """
+    Generator exporting rows of "source" (RowSource, Django's "values"
+    queryset fetched by keyset batches or any iterable) by "exporter"
+    (Exporter instance, e.g. with "csv_fields_order") in given format and
+    yielding the output by batches, optionally gzipped. Memory usage
+    doesn't depend on number of rows and no files are created. Outputs
+    are added to a copy of "exporter", so it can be shared by concurrent
+    exports. Source is checked on call (not on first iteration), so its
+    errors are raised before a streaming response starts.
+    """
+    if exporter is None:
+        exporter = Exporter()
+    else:
+        exporter = copy(exporter)
+        exporter.files = None
+    if hasattr(source, 'model') and hasattr(source, 'query'):
+        source = KeysetQuerySetSource(source)
+    elif not isinstance(source, RowSource):
+        source = IterableSource(source)
+    buffer_ = _StreamBuffer(compress)
+    exporter.add_file(None, file_format, mapper, lang, fileobj=buffer_)
+    return _iter_export(source, exporter, buffer_)
+
+
+def _iter_export(source, exporter, buffer_):
+    exporter.__enter__()
+    try:
+        for batch in source.batches():
+            for entity in batch:
+                exporter.export_entity(entity)
+            data = buffer_.drain()
+            if data:
+                yield data
+    except BaseException:
+        # Including GeneratorExit on client's disconnection.
+        excinfo = sys.exc_info()
+        exporter.__exit__(*excinfo)
+        raise excinfo[0], excinfo[1], excinfo[2]
+    exporter.__exit__(None, None, None)
+    yield buffer_.drain(is_last=True)
+
+
+def export_response(request, source, file_format, exporter=None, mapper=None,
+                    lang=None, filename=None, compress=None):
+    """
+    Returns streaming HTTP response with export of "source" made on the fly
+    (see "iter_export"). Response is gzipped if "compress" is true or, by
+    default, if client accepts gzip encoding. Can be returned by API
+    method's handler:
+
+        @api_method('get', 'json')
+        def products_export(request):
+            qs = Product.objects.filter(is_active=True).values('id', 'name')
+            return export_response(request, qs, 'jsono', filename='p.json')
+    """
+    from .method import get_backend, _set_header
+
+    if compress is None:
+        compress = 'gzip' in request.environ.get('HTTP_ACCEPT_ENCODING', '')
+    chunks = iter_export(
+        source, file_format, exporter, mapper, lang, compress
+    )
+    mime = EXPORT_MIME_TYPES[file_format]
+    backend = get_backend()
+    if backend.is_django:
+        from django.http import StreamingHttpResponse
+
+        response = StreamingHttpResponse(chunks, content_type=mime)
+    else:
+        response = backend.Response(
+            chunks, content_type=mime, direct_passthrough=True
+        )
+    if compress:
+        _set_header(response, 'Content-Encoding', 'gzip')
+    _set_header(response, 'Vary', 'Accept-Encoding')
+    if filename:
+        _set_header(
+            response, 'Content-Disposition',
+            'attachment; filename="%s"' % filename
+        )
+    return response
 
 
 class AsIsExporter(Exporter):
@@ -0,0 +1,379 @@
+"""
+End-to-end load test of antiapi. Starts a sample API application by a local
+server in a separate process, drives it by concurrent clients with a mix of
+requests and reports latency percentiles, latency histogram and throughput.
+Exits with non-zero status if results exceed thresholds:
+
+    python -m antiapi.loadtest --server werkzeug --clients 16 --duration 30
+
+Servers: "werkzeug" (Werkzeug's development server), "wsgiref" (standard
+library WSGI server with threads) and "django" (Django's WSGI handler served
+by wsgiref, requires Django).
+"""
+from argparse import ArgumentParser
+from bisect import bisect_left
+from datetime import datetime
+from decimal import Decimal
+import httplib
+import json
+import logging
+from multiprocessing import Process
+from random import Random
+import socket
+import sys
+from threading import Thread
+from time import sleep, time
+
+from .errors import NotFoundError
+from .method import api_method
+from .validation import Param, validate
+
+# Thresholds of latency percentiles (seconds), minimal throughput
+# (requests per second) and share of failed requests.
+THRESHOLDS = {
+    'p50': 0.05,
+    'p95': 0.25,
+    'p99': 0.5,
+    'min_rps': 50,
+    'max_failures': 0.0,
+}
+
+# Mixes of requests: (weight, name, HTTP method, path, body, status).
+MIXES = {
+    'default': (
+        (30, 'get_json', 'GET', '/items.json?size=10', None, 200),
+        (10, 'get_xml', 'GET', '/items.xml?size=10', None, 200),
+        (10, 'get_jsonp', 'GET', '/items.jsonp?size=10&callback=cb', None,
+         200),
+        (15, 'post_json', 'POST', '/echo.json', '{"ids": [1, 2, 3]}', 200),
+        (10, 'validation_error', 'GET', '/error.json?kind=validation', None,
+         400),
+        (5, 'not_found', 'GET', '/error.xml?kind=not_found', None, 404),
+        (5, 'server_error', 'GET', '/error.json?kind=server', None, 500),
+        (5, 'not_allowed', 'DELETE', '/items.json', None, 405),
+        (10, 'large_list', 'GET', '/items.json?size=5000', None, 200),
+    ),
+    'errors': (
+        (10, 'get_json', 'GET', '/items.json?size=10', None, 200),
+        (30, 'validation_error', 'GET', '/error.json?kind=validation', None,
+         400),
+        (20, 'validation_error_xml', 'GET', '/error.xml?kind=validation',
+         None, 400),
+        (20, 'not_found', 'GET', '/error.json?kind=not_found', None, 404),
+        (20, 'server_error', 'GET', '/error.xml?kind=server', None, 500),
+    ),
+    'large': (
+        (50, 'large_json', 'GET', '/items.json?size=5000', None, 200),
+        (50, 'large_xml', 'GET', '/items.xml?size=5000', None, 200),
+    ),
+}
+
+# Upper bounds of histogram's buckets in seconds.
+HISTOGRAM_BUCKETS = (
+    0.001, 0.002, 0.005, 0.01, 0.02, 0.05, 0.1, 0.2, 0.5, 1, 2, 5, float('inf')
+)
+
+CONTENT_TYPES = ('json', 'xml', 'jsonp')
+
+
+# Sample API methods.
+
+@api_method('get', CONTENT_TYPES)
+def items(request, content_type=None):
+    size = validate(
+        {'size': Param(type='int', default=10, min=0, max=100000)},
+        request.params
+    )['size']
+    now = datetime.now()
+    return {'items': [
+        {
+            'id': i,
+            'name': u'Item %d' % i,
+            'price': Decimal('9.99'),
+            'created': now,
+            'tags': ['new', 'sale'],
+        }
+        for i in xrange(size)
+    ]}
+
+
+@api_method('post', CONTENT_TYPES)
+def echo(request, content_type=None):
+    return request.json_body.data
+
+
+@api_method('get', CONTENT_TYPES)
+def error(request, content_type=None):
+    kind = request.params.get('kind')
+    if kind == 'validation':
+        validate({'id': Param(type='int', required=True)}, request.params)
+    elif kind == 'not_found':
+        raise NotFoundError('Not found')
+    raise RuntimeError('Unexpected error')
+
+
+_views = (('/items', items), ('/echo', echo), ('/error', error))
+
+
+# Servers.
+
+def _werkzeug_app():
+    from werkzeug.wrappers import Response
+
+    from . import method
+    from .routing import Registry
+
+    # Backend detection prefers Django if it's installed (even if it isn't
+    # configured), so Werkzeug mode is forced in the server's process.
+    method._backend = method.Backend(False, object(), Response, Response)
+    registry = Registry()
+    for rule, view in _views:
+        registry.add(rule, view)
+    return registry
+
+
+def _django_app():
+    from django.conf import settings
+
+    settings.configure(
+        DEBUG=False,
+        ALLOWED_HOSTS=['*'],
+        SECRET_KEY='loadtest',
+        ROOT_URLCONF=_DjangoUrls(),
+        MIDDLEWARE_CLASSES=[],
+        MIDDLEWARE=[],
+    )
+    from django.core.wsgi import get_wsgi_application
+
+    return get_wsgi_application()
+
+
+class _DjangoUrls(object):
+    """
+    URL configuration object (Django accepts it in place of module).
+    """
+    @property
+    def urlpatterns(self):
+        from django.conf.urls import url
+
+        return [
+            url(r'^%s\.(?P<content_type>%s)$' % (
+                rule.lstrip('/'), '|'.join(CONTENT_TYPES)
+            ), view)
+            for rule, view in _views
+        ]
+
+
+def _serve(server, host, port):
+    logging.getLogger('antiapi').setLevel(logging.CRITICAL)
+    logging.getLogger('werkzeug').setLevel(logging.ERROR)
+    if server == 'werkzeug':
+        from werkzeug.serving import run_simple
+
+        run_simple(host, port, _werkzeug_app(), threaded=True)
+        return
+    from SocketServer import ThreadingMixIn
+    from wsgiref.simple_server import make_server, WSGIServer, \
+        WSGIRequestHandler
+
+    class ThreadingWSGIServer(ThreadingMixIn, WSGIServer):
+        daemon_threads = True
+
+    class QuietHandler(WSGIRequestHandler):
+        def log_message(self, *args):
+            pass
+
+    if server == 'django':
+        app = _django_app()
+    else:
+        app = _werkzeug_app()
+    make_server(
+        host, port, app, ThreadingWSGIServer, QuietHandler
+    ).serve_forever()
+
+
+def _free_port(host):
+    sock = socket.socket()
+    sock.bind((host, 0))
+    port = sock.getsockname()[1]
+    sock.close()
+    return port
+
+
+def _wait_for_server(host, port, process, timeout=10):
+    deadline = time() + timeout
+    while time() < deadline:
+        if not process.is_alive():
+            raise RuntimeError(
+                'Server has exited with code %s' % process.exitcode
+            )
+        try:
+            socket.create_connection((host, port), 0.1).close()
+            return
+        except socket.error:
+            sleep(0.05)
+    raise RuntimeError('Server has not started in %d sec' % timeout)
+
+
+# Client part.
+
+class Stats(object):
+    """
+    Latencies of requests of one kind.
+    """
+    def __init__(self):
+        self.latencies = []
+        self.failures = 0
+
+    def add(self, latency, is_ok):
+        self.latencies.append(latency)
+        if not is_ok:
+            self.failures += 1
+
+    def merge(self, other):
+        self.latencies.extend(other.latencies)
+        self.failures += other.failures
+
+    def percentile(self, percent):
+        if not self.latencies:
+            return 0
+        latencies = sorted(self.latencies)
+        return latencies[
+            min(len(latencies) - 1, int(len(latencies) * percent / 100.0))
+        ]
+
+    def histogram(self):
+        counts = [0] * len(HISTOGRAM_BUCKETS)
+        for latency in self.latencies:
+            counts[bisect_left(HISTOGRAM_BUCKETS, latency)] += 1
+        return zip(HISTOGRAM_BUCKETS, counts)
+
+
+def _client(host, port, mix, deadline, seed, stats):
+    random = Random(seed)
+    weights = []
+    total = 0
+    for scenario in mix:
+        total += scenario[0]
+        weights.append(total)
+    while time() < deadline:
+        _, name, method, path, body, status = \
+            mix[bisect_left(weights, random.uniform(0, total))]
+        headers = {}
+        if body is not None:
+            headers['Content-Type'] = 'application/json'
+        start = time()
+        try:
+            conn = httplib.HTTPConnection(host, port, timeout=30)
+            conn.request(method, path, body, headers)
+            response = conn.getresponse()
+            response.read()
+            conn.close()
+            is_ok = response.status == status
+        except (socket.error, httplib.HTTPException):
+            is_ok = False
+        stats.setdefault(name, Stats()).add(time() - start, is_ok)
+
+
+def run(server='werkzeug', clients=8, duration=10, mix='default',
+        host='127.0.0.1'):
+    """
+    Runs load test and returns dict of stats by requests' names.
+    """
+    port = _free_port(host)
+    process = Process(target=_serve, args=(server, host, port))
+    process.daemon = True
+    process.start()
+    try:
+        _wait_for_server(host, port, process)
+        deadline = time() + duration
+        results = [{} for _ in xrange(clients)]
+        threads = [
+            Thread(target=_client, args=(
+                host, port, MIXES[mix], deadline, seed, results[seed]
+            ))
+            for seed in xrange(clients)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+    finally:
+        process.terminate()
+    stats = {}
+    for result in results:
+        for name, _stats in result.iteritems():
+            stats.setdefault(name, Stats()).merge(_stats)
+    return stats
+
+
+def report(stats, duration, thresholds, out=sys.stdout):
+    """
+    Prints report and returns list of exceeded thresholds.
+    """
+    total = Stats()
+    out.write('%-22s %8s %8s %9s %9s %9s\n' % (
+        'request', 'count', 'failed', 'p50 ms', 'p95 ms', 'p99 ms'
+    ))
+    for name in sorted(stats) + ['TOTAL']:
+        if name == 'TOTAL':
+            _stats = total
+        else:
+            _stats = stats[name]
+            total.merge(_stats)
+        out.write('%-22s %8d %8d %9.1f %9.1f %9.1f\n' % (
+            name, len(_stats.latencies), _stats.failures,
+            _stats.percentile(50) * 1000, _stats.percentile(95) * 1000,
+            _stats.percentile(99) * 1000,
+        ))
+    rps = len(total.latencies) / float(duration)
+    out.write('\nThroughput: %.1f requests/sec\n\nLatency histogram:\n' % rps)
+    count = len(total.latencies) or 1
+    for bound, bucket in total.histogram():
+        out.write('  <= %-8s %8d %s\n' % (
+            '%gms' % (bound * 1000), bucket, '#' * (60 * bucket // count)
+        ))
+
+    exceeded = []
+    for percent in (50, 95, 99):
+        key = 'p%d' % percent
+        if total.percentile(percent) > thresholds[key]:
+            exceeded.append('%s latency %.3f sec > %.3f sec' % (
+                key, total.percentile(percent), thresholds[key]
+            ))
+    if rps < thresholds['min_rps']:
+        exceeded.append('throughput %.1f rps < %.1f rps' % (
+            rps, thresholds['min_rps']
+        ))
+    failures = total.failures / float(count)
+    if failures > thresholds['max_failures']:
+        exceeded.append('failures %.2f%% > %.2f%%' % (
+            failures * 100, thresholds['max_failures'] * 100
+        ))
+    return exceeded
+
+
+def main(argv=None):
+    parser = ArgumentParser(description='Load test of antiapi.')
+    parser.add_argument('--server', default='werkzeug',
+                        choices=('werkzeug', 'wsgiref', 'django'))
+    parser.add_argument('--clients', type=int, default=8)
+    parser.add_argument('--duration', type=float, default=10)
+    parser.add_argument('--mix', default='default', choices=sorted(MIXES))
+    parser.add_argument('--thresholds',
+                        help='JSON file overriding default thresholds')
+    args = parser.parse_args(argv)
+
+    thresholds = dict(THRESHOLDS)
+    if args.thresholds:
+        with open(args.thresholds) as f:
+            thresholds.update(json.load(f))
+    stats = run(args.server, args.clients, args.duration, args.mix)
+    exceeded = report(stats, args.duration, thresholds)
+    for message in exceeded:
+        sys.stdout.write('FAILED: %s\n' % message)
+    return 1 if exceeded else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
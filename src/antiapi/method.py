@@ -1,22 +1,44 @@
+from collections import namedtuple
 import logging
 from os import path
+from threading import Lock
+from urlparse import parse_qsl
 
-try:
-    from django.conf import settings
-    from django.http import HttpResponse as Response
-    settings.DEBUG  # Try to get DEBUG to initialize lazy Django settings.
-    IS_DJANGO = True
-except ImportError:
-    from werkzeug.wrappers import Response
-    settings = object()
-    IS_DJANGO = False
-
+from .body import JsonBody, MAX_BODY_SIZE
+from .cache import LocalCache, SingleFlight
 from .errors import ValidationError, NotFoundError, AuthError, \
-    MultipleChoicesError
+    MultipleChoicesError, OverloadError, PayloadTooLargeError, \
+    UnsupportedMediaTypeError
 from .serializers import to_json, to_xml, to_jsonp
+from .validation import Param, validate
 
 logger = logging.getLogger('antiapi')
 
+Backend = namedtuple('Backend', 'is_django settings Response BaseResponse')
+_backend = None
+
+
+def get_backend():
+    """
+    Returns web framework (Django or Werkzeug) used by API. It's detected on
+    first call, so import of the module doesn't configure Django settings
+    and doesn't import any framework.
+    """
+    global _backend
+    if _backend is None:
+        try:
+            from django.conf import settings
+            from django.http import HttpResponse as Response
+            from django.http.response import HttpResponseBase
+            # Try to get DEBUG to initialize lazy Django settings.
+            settings.DEBUG
+            _backend = Backend(True, settings, Response, HttpResponseBase)
+        except ImportError:
+            from werkzeug.wrappers import Response
+            _backend = Backend(False, object(), Response, Response)
+    return _backend
+
+
 _serializers = {
     'xml': to_xml,
     'json': to_json,
@@ -34,11 +56,30 @@ MIME_TYPES = {
     'csv': 'text/csv',
 }
 
+# Content type of pretty printed JSON which can contain non-ASCII symbols.
+PRETTY_JSON_MIME_TYPE = 'application/json; charset=utf-8'
+
+# Serialized bodies of error responses without extra data:
+# {(status code, message, content type): body}.
+_error_bodies = LocalCache(max_size=1000, ttl=24 * 3600)
+
 # List of HTTP methods.
 # http://en.wikipedia.org/wiki/HTTP#Request_methods
 # http://tools.ietf.org/html/rfc2616#page-51
 HTTP_METHODS = {'get', 'post', 'put', 'delete', 'head', 'options', 'trace'}
 
+# Options of API methods configuring processing of requests. They are
+# passed with serializer's parameters, but never reach serializers.
+ENDPOINT_OPTIONS = (
+    'limiter', 'allowed_fields', 'max_body_size', 'profiler', 'coalesce',
+)
+
+# Coalescing of identical concurrent requests (see process_api_method):
+# {timeout: SingleFlight instance}.
+_flights = {}
+_flights_lock = Lock()
+COALESCE_TIMEOUT = 10
+
 
 def api_method(http_methods, content_types, is_secure=False,
                **serializer_params):
@@ -56,6 +97,11 @@ def api_method(http_methods, content_types, is_secure=False,
                     *args, **kwargs
                 )
             return _method_not_allowed(http_methods)
+        _method.__name__ = func.__name__
+        _method.__doc__ = func.__doc__
+        # Used by antiapi.routing.Registry to build URL rules.
+        _method.content_types = content_types
+        _method.http_methods = http_methods
         return _method
     return wrapper
 
@@ -95,6 +141,22 @@ class ApiMethod(object):
     # Forces to use HTTPS for requesting API method.
     is_https_only = False
 
+    # Admission control of API method (antiapi.throttling.Limiter instance).
+    limiter = None
+
+    # Fields (or paths of nested fields like "vendor.name") allowed to be
+    # selected by "fields" request parameter. See process_api_method.
+    allowed_fields = None
+
+    # Limit of JSON request body size in bytes (see process_api_method).
+    max_body_size = MAX_BODY_SIZE
+
+    # Profiler of API method (antiapi.profiling.Profiler instance).
+    profiler = None
+
+    # Coalesce identical concurrent GET requests (see process_api_method).
+    coalesce = False
+
     # Dict to storing HTTP cookies. Use "set_cookie" method to set cookie
     # in your API method's code. Cookies will be set in response's rendering.
     _http_cookies = None
@@ -124,17 +186,16 @@ class ApiMethod(object):
 #                and getattr(settings, 'HTTPS_SUPPORT', False):
 #            return self.error(403, 'This method is available by HTTPS only')
 
-        http_method = self.request.method.lower()
-        if 'HTTP_X_HTTP_METHOD_OVERRIDE' in self.request.META:
-            http_method = \
-                self.request.META['HTTP_X_HTTP_METHOD_OVERRIDE'].lower()
-        else:
-            http_method = self.request.method.lower()
-        if (http_method in self.HTTP_METHODS and hasattr(self, 'http_' +
-                                                         http_method)):
+        # Both Django's and Werkzeug's requests have WSGI environ.
+        http_method = self.request.environ.get(
+            'HTTP_X_HTTP_METHOD_OVERRIDE', self.request.method
+        ).lower()
+        if http_method in HTTP_METHODS and hasattr(self, http_method):
             handler = getattr(self, http_method)
         else:
-            handler = self._method_not_allowed
+            return _method_not_allowed(sorted(
+                method for method in HTTP_METHODS if hasattr(self, method)
+            ))
 
 #        # Check authentication possibly provided by additional mixin classes.
 #        if hasattr(self, 'authenticate'):
@@ -148,7 +209,15 @@ class ApiMethod(object):
 
         return process_api_method(
             self.request, handler, self.content_types,
-            {'xml_root_node': self.xml_root_node}
+            {
+                'xml_root_node': self.xml_root_node,
+                'limiter': self.limiter,
+                'allowed_fields': self.allowed_fields,
+                'max_body_size': self.max_body_size,
+                'profiler': self.profiler,
+                'coalesce': self.coalesce,
+            },
+            *args, **kwargs
         )
 
         if isinstance(data, HttpResponse):
@@ -172,13 +241,154 @@ class ApiMethod(object):
 
 def process_api_method(request, handler, content_types, serializer_params,
                        *args, **kwargs):
+    """
+    Calls API method's handler and serializes its result to HTTP response.
+    "Serializer_params" are passed to serializer except endpoint options
+    (see ENDPOINT_OPTIONS).
+    If "allowed_fields" is specified, client can select a subset of them
+    by "fields" parameter (e.g. "?fields=id,vendor.name").
+    Selected fields are available to handler as "request.fields" (None if
+    all fields are requested) and as "request.field_lookups" with "__"
+    separators (e.g. "vendor__name") to limit a query by "only" or
+    "values". Other fields are dropped from the response on serialization.
+    JSON and NDJSON request bodies are available to handler as lazily
+    decoded "request.json_body" (see antiapi.body.JsonBody) limited by
+    "max_body_size" (bytes).
+    Requests are admitted by "limiter" (see antiapi.throttling.Limiter) and
+    profiled by "profiler" (see antiapi.profiling.Profiler).
+    If "coalesce" is true (or a timeout in seconds), concurrent GET
+    requests of API method with the same URL path and query parameters
+    wait for one in-flight call of handler and share its response. Use it
+    only for API methods which responses don't depend on anything else
+    (e.g. on user or cookies). Streaming responses (e.g. made by
+    antiapi.export.export_response) can't be shared, so waiters call
+    handler themselves then.
+    """
+    options, serializer_params = _split_options(serializer_params)
+    coalesce = options.get('coalesce')
+    if coalesce and request.method in ('GET', 'HEAD'):
+        timeout = COALESCE_TIMEOUT if coalesce is True else coalesce
+        # Streaming response made by this request's call of handler.
+        streamed = []
+        parts = _flight(timeout).do(
+            _coalesce_key(request, handler), _response_parts, streamed,
+            request, handler, content_types, serializer_params, options,
+            *args, **kwargs
+        )
+        if parts is None:
+            if streamed:
+                return streamed[0]
+            return _profile_api_method(
+                request, handler, content_types, serializer_params, options,
+                *args, **kwargs
+            )
+        status, headers, body = parts
+        response = get_backend().Response(body, status=status)
+        for header, value in headers:
+            _set_header(response, header, value)
+        return response
+    return _profile_api_method(
+        request, handler, content_types, serializer_params, options,
+        *args, **kwargs
+    )
+
+
+def _flight(timeout):
+    flight = _flights.get(timeout)
+    if flight is None:
+        with _flights_lock:
+            flight = _flights.get(timeout)
+            if flight is None:
+                flight = _flights[timeout] = SingleFlight(timeout)
+    return flight
+
+
+def _split_options(params):
+    """
+    Splits parameters of API method to endpoint options and serializer's
+    parameters.
+    """
+    options = {}
+    serializer_params = {}
+    for key, value in params.iteritems():
+        if key in ENDPOINT_OPTIONS:
+            options[key] = value
+        else:
+            serializer_params[key] = value
+    return options, serializer_params
+
+
+def _coalesce_key(request, handler):
+    query = parse_qsl(
+        request.environ.get('QUERY_STRING', ''), keep_blank_values=True
+    )
+    return (
+        _endpoint_name(handler), request.method,
+        request.environ.get('PATH_INFO'), tuple(sorted(query)),
+    )
+
+
+def _response_parts(streamed, request, handler, content_types,
+                    serializer_params, options, *args, **kwargs):
+    """
+    Returns status, headers and body of API method's response to share them
+    between coalesced requests. Streaming response is appended to
+    "streamed" list and None is returned.
+    """
+    response = _profile_api_method(
+        request, handler, content_types, serializer_params, options,
+        *args, **kwargs
+    )
+    # Django's streaming responses and Werkzeug's ones with iterable body.
+    if getattr(response, 'streaming', False) or \
+            getattr(response, 'is_streamed', False):
+        streamed.append(response)
+        return None
+    if get_backend().is_django:
+        return response.status_code, response.items(), response.content
+    return (
+        response.status_code,
+        [(k, v) for k, v in response.headers if k != 'Content-Length'],
+        response.get_data(),
+    )
+
+
+def _profile_api_method(request, handler, content_types, serializer_params,
+                        options, *args, **kwargs):
+    profiler = options.get('profiler')
+    if profiler is not None and profiler.should_profile(request):
+        return profiler.profile(
+            _endpoint_name(handler), _process_api_method, request, handler,
+            content_types, serializer_params, options, *args, **kwargs
+        )
+    return _process_api_method(
+        request, handler, content_types, serializer_params, options,
+        *args, **kwargs
+    )
+
+
+def _process_api_method(request, handler, content_types, serializer_params,
+                        options, *args, **kwargs):
     patch_request(request)
+    request.json_body = JsonBody(
+        request, options.get('max_body_size', MAX_BODY_SIZE)
+    )
     content_type = _get_content_type(
         request, content_types,  *args, **kwargs
     )
     err_kwargs = {'content_type': content_type}
+    limiter = options.get('limiter')
+    if limiter is not None:
+        handler = limiter(handler)
+    allowed_fields = options.get('allowed_fields')
 
     try:
+        if allowed_fields is not None:
+            request.fields = _get_fields(request, allowed_fields)
+            request.field_lookups = request.fields and [
+                field.replace('.', '__') for field in request.fields
+            ]
+            serializer_params['fields'] = request.fields
         data = handler(request, *args, **kwargs)
     except ValidationError as e:
         err_kwargs.update(e.__dict__)
@@ -190,32 +400,42 @@ def process_api_method(request, handler, content_types, serializer_params,
     except MultipleChoicesError as e:
         err_kwargs.update(e.body)
         return _http_error(300, unicode(e), **err_kwargs)
+    except PayloadTooLargeError as e:
+        return _http_error(413, unicode(e), **err_kwargs)
+    except UnsupportedMediaTypeError as e:
+        return _http_error(415, unicode(e), **err_kwargs)
+    except OverloadError as e:
+        response = _http_error(503, unicode(e), **err_kwargs)
+        _set_header(response, 'Retry-After', str(e.retry_after))
+        return response
     except Exception as e:
-        if getattr(settings, 'API_DEBUG', False):
+        if getattr(get_backend().settings, 'API_DEBUG', False):
             raise
         logger.exception(e)
         return _http_error(500, 'Unexpected API error',
                            content_type=content_type)
 
+    if isinstance(data, get_backend().BaseResponse):
+        # Handler has made response itself (e.g. streaming one).
+        return data
+
     if content_type == 'jsonp' and 'jsonp_callback' not in serializer_params:
-        serializer_params['jsonp_callback'] = request.args.get(
-            'callback',
-            request.form.get('callback', 'callback')
+        serializer_params['jsonp_callback'] = request.params.get(
+            'callback', 'callback'
         )
-    serializer_params['is_pretty'] = request.args.get(
-        '_pretty',
-        request.form.get('_pretty')
-    )
+    serializer_params['is_pretty'] = request.params.get('_pretty')
+    if content_type != 'xml':
+        # API method has the same parameters for all its content types.
+        serializer_params.pop('xml_root_node', None)
 
-    response = Response(
-        _serializers[content_type](data, **serializer_params),
-        content_type=MIME_TYPES[content_type]
-    )
     if content_type.startswith('json') and serializer_params['is_pretty']:
-        mime = 'application/json; charset=utf-8'
+        mime = PRETTY_JSON_MIME_TYPE
     else:
         mime = MIME_TYPES[content_type]
-    _set_header(response, 'Content-Type', mime)
+    # Serializers return UTF-8 encoded strings, so body isn't encoded again.
+    body = _serializers[content_type](data, **serializer_params)
+    response = get_backend().Response(body, content_type=mime)
+    _set_header(response, 'Content-Length', str(len(body)))
 #    if getattr(self, 'http_status_code', None):
 #        response.status_code = self.http_status_code
 #    if self._http_cookies:
@@ -225,14 +445,109 @@ def process_api_method(request, handler, content_types, serializer_params,
     return response
 
 
+def _endpoint_name(handler):
+    name = getattr(handler, '__name__', 'api_method')
+    cls = getattr(handler, 'im_class', None)
+    if cls is not None:
+        return '%s.%s' % (cls.__name__, name)
+    return name
+
+
+def _get_fields(request, allowed_fields):
+    params = {
+        'fields': Param(type='unicode', many=True, set=allowed_fields),
+    }
+    return validate(params, request.params).get('fields')
+
+
+class RequestParams(object):
+    """
+    Read-only view of request's parameters shared by API and its methods
+    as "request.params". Query string parameters are looked up first, body
+    is parsed only if a key isn't found in query string and HTTP method has
+    a body, so GET requests never parse body. Supports "get", "getlist" and
+    "in", so it can be passed to "validate".
+    """
+    BODY_METHODS = ('POST', 'PUT', 'PATCH', 'DELETE')
+
+    def __init__(self, request):
+        self._request = request
+        self._has_body = request.method in self.BODY_METHODS
+
+    def _form(self):
+        if not self._has_body:
+            return None
+        return self._request.form
+
+    def get(self, key, default=None):
+        args = self._request.args
+        if key in args:
+            return args.get(key)
+        form = self._form()
+        if form is not None and key in form:
+            return form.get(key)
+        return default
+
+    def getlist(self, key):
+        values = self._request.args.getlist(key)
+        if values:
+            return values
+        form = self._form()
+        if form is not None:
+            return form.getlist(key)
+        return []
+
+    def __contains__(self, key):
+        if key in self._request.args:
+            return True
+        form = self._form()
+        return form is not None and key in form
+
+    def __getitem__(self, key):
+        value = self.get(key, self)
+        if value is self:
+            raise KeyError(key)
+        return value
+
+
+class _LazyPost(object):
+    """
+    Proxy of Django's "request.POST" which parses body on first access.
+    """
+    def __init__(self, request):
+        self._request = request
+
+    def __getattr__(self, name):
+        return getattr(self._request.POST, name)
+
+    def __contains__(self, key):
+        return key in self._request.POST
+
+    def __getitem__(self, key):
+        return self._request.POST[key]
+
+    def __iter__(self):
+        return iter(self._request.POST)
+
+    def __len__(self):
+        return len(self._request.POST)
+
+
 def patch_request(request):
-    if IS_DJANGO:
+    """
+    Adds Werkzeug-like "args" and "form" to Django's request and "params"
+    (see RequestParams) to any request. Nothing is parsed here.
+    """
+    if 'params' in request.__dict__:
+        return
+    if get_backend().is_django:
         request.args = request.GET
-        request.form = request.POST
+        request.form = _LazyPost(request)
+    request.params = RequestParams(request)
 
 
 def _set_header(response, header, value):
-    if IS_DJANGO:
+    if get_backend().is_django:
         response[header] = value
     else:
         response.headers[header] = value
@@ -291,10 +606,28 @@ def _get_content_type(request, content_types, *args, **kwargs):
 
 
 def _http_error(status_code=400, message='', content_type=None, **kwargs):
-    response = Response(status=status_code)
-    data = None
+    """
+    Returns error response. Bodies of errors without extra data in
+    "kwargs" are serialized once and cached.
+    """
+    if kwargs:
+        body = _error_body(message, content_type, kwargs)
+    else:
+        key = (status_code, message, content_type)
+        body = _error_bodies.get(key)
+        if body is None:
+            body = _error_body(message, content_type, kwargs)
+            _error_bodies.set(key, body)
+    response = get_backend().Response(
+        body, status=status_code,
+        content_type=MIME_TYPES[content_type] if content_type else None
+    )
+    _set_header(response, 'Content-Length', str(len(body)))
+    return response
+
+
+def _error_body(message, content_type, kwargs):
     if content_type:
-        _set_header(response, 'Content-Type', MIME_TYPES[content_type])
         body = {}
         if message:
             body['message'] = message
@@ -303,19 +636,18 @@ def _http_error(status_code=400, message='', content_type=None, **kwargs):
         if body:
             params = {}
             if content_type == 'xml':
-                params['root_node'] = 'error'
-            data = _serializers[content_type](body, **params)
+                params['xml_root_node'] = 'error'
+            return _serializers[content_type](body, **params)
     elif message:
-        data = message
-    if data is not None:
-        if IS_DJANGO:
-            response.content = data
-        else:
-            response.data = data
-    return response
+        if isinstance(message, unicode):
+            return message.encode('utf-8')
+        return message
+    return ''
 
 
-def _method_not_allowed(allowed_methods):
-    response = _http_error(405, 'Method Not Allowed')
-    response['Allow'] = ', '.join(map(str.upper, allowed_methods))
+def _method_not_allowed(allowed_methods, content_type=None):
+    response = _http_error(405, 'Method Not Allowed', content_type)
+    _set_header(
+        response, 'Allow', ', '.join(map(str.upper, allowed_methods))
+    )
     return response
@@ -2,10 +2,20 @@
 
 from base64 import b64encode
 from hashlib import sha256
+from itertools import izip
 from random import getrandbits, choice
+from time import time
+from zlib import crc32
 
 from django.core.cache import cache
 from django.core.exceptions import ObjectDoesNotExist
+from django.db import router
+from django.db.models.base import ModelState
+
+from .cache import LocalCache, SingleFlight
+
+# Value cached for non existent key ids (negative caching).
+_MISSING = 'API_KEY_MISSING'
 
 
 def keygen():
@@ -18,29 +28,78 @@ def keygen():
     ).rstrip('=')
 
 
+# Fields order of serializable models: {model: (fields, signature)}.
+_fields_orders = {}
+
+
 class SerializableMixin(object):
+    @classmethod
+    def serialized_fields(cls):
+        """
+        Returns tuple of model's concrete fields' attribute names computed
+        once per model and their order's signature.
+        """
+        try:
+            return _fields_orders[cls]
+        except KeyError:
+            fields = tuple(
+                field.attname for field in cls._meta.concrete_fields
+            )
+            order = _fields_orders[cls] = (fields, crc32(','.join(fields)))
+            return order
+
     def serialize(self):
         """
-        Returns only valuable fields of Django model's __dict__.
+        Returns compact tuple of model's fields values in order of
+        "serialized_fields" prefixed by the order's signature. Non-model
+        objects are serialized to dict of their valuable __dict__ fields.
         """
-        return {
-            k: v
-            for k, v in self.__dict__.viewitems()
-            if not k.startswith('_')
-        }
+        if not hasattr(self, '_meta'):
+            return {
+                k: v
+                for k, v in self.__dict__.viewitems()
+                if not k.startswith('_')
+            }
+        fields, signature = self.serialized_fields()
+        return (signature, ) + tuple(getattr(self, field) for field in fields)
 
     @classmethod
-    def deserialize(cls, dict_):
-        return cls(**dict_)
+    def deserialize(cls, data):
+        """
+        Restores object serialized by "serialize". Model instances are
+        restored without calling of __init__ (and sending of init signals)
+        like Django does for rows loaded from database. Returns None if data
+        was serialized with another fields order (e.g. before migration).
+        """
+        if isinstance(data, dict):
+            return cls(**data)
+        fields, signature = cls.serialized_fields()
+        if data[0] != signature:
+            return None
+        obj = cls.__new__(cls)
+        obj.__dict__.update(izip(fields, data[1:]))
+        obj._state = ModelState()
+        obj._state.adding = False
+        obj._state.db = router.db_for_read(cls, instance=obj)
+        return obj
 
 
 class AuthKeyMixin(SerializableMixin):
     CACHE_TTL = 3600
+    # TTL of cached misses, so requests with non existent or malformed key
+    # ids don't hit database every time.
+    NEGATIVE_CACHE_TTL = 60
+    # In-process cache tier in front of Django's cache. Other processes
+    # don't see "drop_cache" calls, so keep its TTL short.
+    LOCAL_CACHE_TTL = 10
+    _local_cache = LocalCache(max_size=10000, ttl=LOCAL_CACHE_TTL)
+    _loads = SingleFlight()
 
     def save(self, *args, **kwargs):
         """
         Generates a new auth key.
         """
+        is_new = self._state.adding
         if not self.key and not kwargs.pop('force_empty_key', False):
             for _ in xrange(50):
                 key = keygen()
@@ -52,41 +111,201 @@ class AuthKeyMixin(SerializableMixin):
                 raise AssertionError(
                     'keygen() returned not unique value 50 times'
                 )
-        return super(AuthKeyMixin, self).save(*args, **kwargs)
+        result = super(AuthKeyMixin, self).save(*args, **kwargs)
+        if is_new:
+            # Drop possibly cached miss for the new id.
+            self.drop_cache()
+        return result
+
+    @classmethod
+    def bulk_create_keys(cls, count, batch_size=1000, **fields):
+        """
+        Creates "count" new auth keys with the same "fields" values by
+        "batch_size" pieces. Uniqueness of generated keys is checked by one
+        "key__in" query per batch of candidates, so issuing of many keys
+        takes a few queries instead of two queries per key.
+        Returns list of created objects.
+        """
+        keys = set()
+        for _ in xrange(50):
+            need = count - len(keys)
+            if not need:
+                break
+            candidates = {keygen() for _ in xrange(need)} - keys
+            candidates_list = list(candidates)
+            for start in xrange(0, len(candidates_list), batch_size):
+                candidates.difference_update(
+                    cls.objects.filter(
+                        key__in=candidates_list[start:start + batch_size]
+                    ).values_list('key', flat=True)
+                )
+            keys |= candidates
+        # Prevent endless cycle
+        if len(keys) < count:
+            raise AssertionError(
+                'keygen() returned not unique values 50 times'
+            )
+        auth_keys = [cls(key=key, **fields) for key in keys]
+        cls.objects.bulk_create(auth_keys, batch_size=batch_size)
+        # Drop possibly cached misses for new ids (if database returns them).
+        cls.drop_cache_many([
+            auth_key.pk for auth_key in auth_keys if auth_key.pk is not None
+        ])
+        return auth_keys
 
     @classmethod
     def get_key(cls, key_id):
-        cache_key = cls._cache_key(cls.__name__, key_id)
-        data = cache.get(cache_key)
-        if data:
-            return cls.deserialize(data)
+        cache_key = cls._cache_key(cls.__name__, key_id, cls._generation())
+        data = cls._local_cache.get(cache_key)
+        if data is None:
+            # Concurrent misses of the same key are collapsed into one load.
+            data = cls._loads.do(cache_key, cls._load_key, cache_key, key_id)
+        if data == _MISSING:
+            raise ValueError('Non existent key with id=%s' % str(key_id))
+        auth_key = cls.deserialize(data)
+        if auth_key is None:
+            # Cached by code with another fields order.
+            cls._local_cache.delete(cache_key)
+            cache.delete(cache_key)
+            return cls.get_key(key_id)
+        return auth_key
 
+    @classmethod
+    def _key_queryset(cls):
         if hasattr(cls, 'key_queryset'):
-            qs = cls.key_queryset()
+            return cls.key_queryset()
+        return cls.objects
+
+    @classmethod
+    def _load_key(cls, cache_key, key_id):
+        """
+        Returns serialized key from Django's cache or database and fills
+        both cache tiers.
+        """
+        data = cache.get(cache_key)
+        if data is None:
+            try:
+                data = cls._key_queryset().get(pk=key_id).serialize()
+                ttl = cls.CACHE_TTL
+            except (ObjectDoesNotExist, ValueError):
+                # ValueError are thrown by non integer key_id.
+                data = _MISSING
+                ttl = cls.NEGATIVE_CACHE_TTL
+            cache.set(cache_key, data, ttl)
+        cls._set_local(cache_key, data)
+        return data
+
+    @classmethod
+    def _set_local(cls, cache_key, data):
+        if data == _MISSING:
+            ttl = min(cls.LOCAL_CACHE_TTL, cls.NEGATIVE_CACHE_TTL)
         else:
-            qs = cls.objects
-        try:
-            auth_key = qs.get(pk=key_id)
-        except (ObjectDoesNotExist, ValueError):
-            # ValueError are thrown by non integer key_id.
-            raise ValueError('Non existent key with id=%s' % str(key_id))
-        cache.set(
-            cache_key,
-            auth_key.serialize(),
-            cls.CACHE_TTL
-        )
-        return auth_key
+            ttl = cls.LOCAL_CACHE_TTL
+        cls._local_cache.set(cache_key, data, ttl)
+
+    @classmethod
+    def warm_cache(cls, key_ids):
+        """
+        Loads keys with given ids to both cache tiers by one "get_many" call
+        to Django's cache and one query to database for the missed keys.
+        """
+        generation = cls._generation()
+        cache_keys = {
+            cls._cache_key(cls.__name__, key_id, generation): key_id
+            for key_id in key_ids
+        }
+        found = cache.get_many(cache_keys.keys())
+        missed = {
+            str(key_id): cache_key
+            for cache_key, key_id in cache_keys.iteritems()
+            if cache_key not in found
+        }
+        if missed:
+            try:
+                loaded = {
+                    missed[str(auth_key.pk)]: auth_key.serialize()
+                    for auth_key in cls._key_queryset().filter(
+                        pk__in=missed.keys()
+                    )
+                }
+            except ValueError:
+                # Malformed id in the list, load keys one by one.
+                for key_id, cache_key in missed.iteritems():
+                    cls._load_key(cache_key, key_id)
+                missed = {}
+            else:
+                cache.set_many(loaded, cls.CACHE_TTL)
+                found.update(loaded)
+                negative = {
+                    cache_key: _MISSING
+                    for cache_key in missed.itervalues()
+                    if cache_key not in loaded
+                }
+                if negative:
+                    cache.set_many(negative, cls.NEGATIVE_CACHE_TTL)
+                    found.update(negative)
+        for cache_key, data in found.iteritems():
+            cls._set_local(cache_key, data)
 
     def drop_cache(self):
-        cache_key = self._cache_key(self.__class__.__name__, self.id)
-        cache.delete(cache_key)
+        self.drop_cache_many([self.id])
+
+    @classmethod
+    def drop_cache_many(cls, key_ids):
+        generation = cls._generation()
+        cache_keys = [
+            cls._cache_key(cls.__name__, key_id, generation)
+            for key_id in key_ids
+        ]
+        for cache_key in cache_keys:
+            cls._local_cache.delete(cache_key)
+        cache.delete_many(cache_keys)
 
     @classmethod
     def drop_all_cache(cls):
-        for key_id in cls.objects.values_list('id', flat=True).all():
-            cache_key = cls._cache_key(cls.__name__, key_id)
-            cache.delete(cache_key)
+        """
+        Invalidates all cached keys of the class by bumping of cache keys'
+        generation. Entries of old generations expire by CACHE_TTL.
+        """
+        generation_key = cls._generation_key(cls.__name__)
+        try:
+            cache.incr(generation_key)
+        except ValueError:
+            # Generation has been evicted from the cache.
+            cache.set(generation_key, cls._new_generation(), None)
+        cls._local_cache.clear()
+
+    @staticmethod
+    def _new_generation():
+        """
+        Returns a new generation which can't be equal to any of previous,
+        so entries of old generations aren't used again.
+        """
+        return int(time() * 1000000)
+
+    @classmethod
+    def _generation(cls):
+        """
+        Returns current generation of cache keys. It's cached in-process
+        for LOCAL_CACHE_TTL seconds like keys themselves.
+        """
+        generation_key = cls._generation_key(cls.__name__)
+        generation = cls._local_cache.get(generation_key)
+        if generation is None:
+            generation = cache.get(generation_key)
+            if generation is None:
+                # Never set or evicted, so start a new generation (another
+                # process may start it concurrently).
+                generation = cls._new_generation()
+                cache.add(generation_key, generation, None)
+                generation = cache.get(generation_key, generation)
+            cls._local_cache.set(generation_key, generation)
+        return generation
+
+    @staticmethod
+    def _generation_key(class_name):
+        return 'API_KEY_GEN_%s' % class_name
 
     @staticmethod
-    def _cache_key(class_name, key_id):
-        return 'API_KEY_%s_%s' % (class_name, key_id)
+    def _cache_key(class_name, key_id, generation=1):
+        return 'API_KEY_%s_%s_%s' % (class_name, generation, key_id)
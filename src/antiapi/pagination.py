@@ -0,0 +1,134 @@
+from base64 import urlsafe_b64encode, urlsafe_b64decode
+from hashlib import sha256
+import hmac
+from json import loads
+
+from .errors import ValidationError
+from .serializers import to_json
+from .validation import Param
+
+# Length of cursor's signature in bytes.
+SIGNATURE_SIZE = 16
+
+
+def paginate(qs, ordering, cursor=None, limit=20, secret=None):
+    """
+    Returns a page of queryset selected by keyset (cursor) pagination:
+
+        {'items': [...], 'next_cursor': '...'}
+
+    Unlike OFFSET/LIMIT, cost of a page doesn't depend on its depth.
+    "Ordering" is a list of fields like in "order_by" and must define
+    a unique order (e.g. end with "pk"). "Cursor" is an opaque signed token
+    from "next_cursor" of previous page ("next_cursor" of the last page
+    is None). Pass querysets with "values" to get items serializable to
+    JSON and XML.
+    """
+    if isinstance(ordering, basestring):
+        ordering = (ordering, )
+    qs = qs.order_by(*ordering)
+    if cursor:
+        qs = qs.filter(_keyset_filter(
+            ordering, decode_cursor(cursor, ordering, secret)
+        ))
+    items = list(qs[:limit + 1])
+    next_cursor = None
+    if len(items) > limit:
+        items = items[:limit]
+        pk_name = qs.model._meta.pk.attname
+        next_cursor = encode_cursor(
+            [_field_value(items[-1], field, pk_name) for field in ordering],
+            ordering, secret
+        )
+    return {'items': items, 'next_cursor': next_cursor}
+
+
+def cursor_param(ordering, secret=None, **kwargs):
+    """
+    Returns Param for validation of cursor passed by client.
+    """
+    def validator(cursor):
+        try:
+            decode_cursor(cursor, ordering, secret)
+        except ValidationError as e:
+            return e.message
+    return Param(type='unicode', validator=validator, **kwargs)
+
+
+def limit_param(default=20, max=100, **kwargs):
+    """
+    Returns Param for validation of page's size passed by client.
+    """
+    return Param(type='int', default=default, min=1, max=max, **kwargs)
+
+
+def encode_cursor(values, ordering, secret=None):
+    payload = to_json(values)
+    return urlsafe_b64encode(
+        _sign(payload, ordering, secret) + payload
+    ).rstrip('=')
+
+
+def decode_cursor(cursor, ordering, secret=None):
+    """
+    Returns list of ordering fields' values of the last item of previous
+    page or raises ValidationError if cursor is malformed or tampered.
+    """
+    try:
+        if isinstance(cursor, unicode):
+            cursor = cursor.encode('ascii')
+        data = urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+    except (TypeError, UnicodeError):
+        data = ''
+    signature, payload = data[:SIGNATURE_SIZE], data[SIGNATURE_SIZE:]
+    if not payload or not hmac.compare_digest(
+            signature, _sign(payload, ordering, secret)):
+        raise ValidationError('Invalid cursor', key='cursor', code='value')
+    values = loads(payload)
+    if not isinstance(values, list) or len(values) != len(ordering):
+        raise ValidationError('Invalid cursor', key='cursor', code='value')
+    return values
+
+
+def _sign(payload, ordering, secret):
+    # Ordering is signed too, so a cursor can't be reused with another one.
+    return hmac.new(
+        _secret(secret), ','.join(ordering) + '|' + payload, sha256
+    ).digest()[:SIGNATURE_SIZE]
+
+
+def _secret(secret):
+    if secret is None:
+        from django.conf import settings
+        secret = settings.SECRET_KEY
+    if isinstance(secret, unicode):
+        secret = secret.encode('utf-8')
+    return secret
+
+
+def _field_value(item, field, pk_name):
+    name = field.lstrip('-')
+    if isinstance(item, dict):
+        if name == 'pk' and name not in item:
+            # Rows of "values" querysets contain primary key by its name.
+            name = pk_name
+        return item[name]
+    return getattr(item, name)
+
+
+def _keyset_filter(ordering, values):
+    """
+    Builds Q object selecting rows after given values of ordering fields:
+    (f1 > v1) OR (f1 = v1 AND f2 > v2) OR ...
+    """
+    from django.db.models import Q
+
+    result = Q()
+    equals = {}
+    for field, value in zip(ordering, values):
+        name = field.lstrip('-')
+        lookup = '%s__%s' % (name, 'lt' if field.startswith('-') else 'gt')
+        condition = Q(**equals) & Q(**{lookup: value})
+        result = result | condition if result else condition
+        equals[name] = value
+    return result
@@ -0,0 +1,123 @@
+from cProfile import Profile
+from hashlib import sha256
+import hmac
+from itertools import count
+import logging
+import os
+from random import random
+from threading import Lock
+from time import strftime, time
+
+logger = logging.getLogger('antiapi')
+
+
+class Profiler(object):
+    """
+    Profiler of API methods in production. Profiles random "sample_rate"
+    share of requests and requests with a valid signed token in
+    "X-Api-Profile" header (see "make_token"), so a regressed API method
+    can be profiled without redeploying. Results are dumped by cProfile in
+    pstats format to "<directory>/<API method>/" until total size of dumps
+    in the directory exceeds "max_total_size" bytes. Dumps of other
+    processes sharing the directory are counted by rescanning it before
+    profiling at most once per RESCAN_INTERVAL seconds. Usage:
+
+        profiler = Profiler('/var/tmp/api-profiles', sample_rate=0.001,
+                            secret=settings.SECRET_KEY)
+
+        @api_method('get', 'json', profiler=profiler)
+        def products(request):
+            ...
+
+    or "profiler" attribute of ApiMethod's child class. Dumps are viewed by
+    "python -m pstats <file>" or converted to flame graphs by external tools.
+    """
+    HEADER = 'HTTP_X_API_PROFILE'
+    RESCAN_INTERVAL = 10
+
+    def __init__(self, directory, sample_rate=0.0, secret=None,
+                 max_total_size=100 * 1024 * 1024):
+        self.directory = directory
+        self.sample_rate = sample_rate
+        self.secret = secret
+        self.max_total_size = max_total_size
+        self._lock = Lock()
+        self._counter = count()
+        self._scanned = time()
+        self._total_size = self._directory_size()
+
+    def should_profile(self, request):
+        if not (self.sample_rate and random() < self.sample_rate):
+            token = request.environ.get(self.HEADER)
+            if not (token and self.secret and self._is_valid_token(token)):
+                return False
+        self._rescan()
+        return self._total_size < self.max_total_size
+
+    def _rescan(self):
+        """
+        Updates total size of dumps by the directory if it was scanned more
+        than RESCAN_INTERVAL seconds ago.
+        """
+        now = time()
+        with self._lock:
+            if now - self._scanned < self.RESCAN_INTERVAL:
+                return
+            self._scanned = now
+        size = self._directory_size()
+        with self._lock:
+            self._total_size = size
+
+    def _directory_size(self):
+        size = 0
+        for root, _, filenames in os.walk(self.directory):
+            for filename in filenames:
+                try:
+                    size += os.path.getsize(os.path.join(root, filename))
+                except OSError:
+                    # Deleted concurrently.
+                    pass
+        return size
+
+    def make_token(self, ttl=3600):
+        """
+        Returns token for "X-Api-Profile" header valid for "ttl" seconds.
+        """
+        expires = str(int(time() + ttl))
+        return '%s:%s' % (expires, self._sign(expires))
+
+    def _is_valid_token(self, token):
+        expires, _, signature = token.partition(':')
+        if not expires.isdigit() or int(expires) < time():
+            return False
+        return hmac.compare_digest(str(signature), self._sign(expires))
+
+    def _sign(self, value):
+        secret = self.secret
+        if isinstance(secret, unicode):
+            secret = secret.encode('utf-8')
+        return hmac.new(secret, value, sha256).hexdigest()
+
+    def profile(self, endpoint, func, *args, **kwargs):
+        """
+        Calls "func" under profiler and dumps results for "endpoint".
+        """
+        profile = Profile()
+        try:
+            return profile.runcall(func, *args, **kwargs)
+        finally:
+            self._dump(endpoint, profile)
+
+    def _dump(self, endpoint, profile):
+        directory = os.path.join(self.directory, endpoint)
+        filename = os.path.join(directory, '%s-%d-%d.pstats' % (
+            strftime('%Y%m%d-%H%M%S'), os.getpid(), next(self._counter)
+        ))
+        try:
+            if not os.path.isdir(directory):
+                os.makedirs(directory)
+            profile.dump_stats(filename)
+            with self._lock:
+                self._total_size += os.path.getsize(filename)
+        except (IOError, OSError) as e:
+            logger.warning('Cannot dump profile of %s: %s' % (endpoint, e))
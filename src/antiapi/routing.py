@@ -0,0 +1,122 @@
+from os import path
+
+from .method import ApiMethod, _http_error, _method_not_allowed, \
+    _serializers
+
+
+class Registry(object):
+    """
+    Registry of API methods for Werkzeug deployments. All registered
+    methods are compiled to a single Werkzeug's URL map with content type
+    extension folded into every rule, so a request is dispatched by one
+    match and content type is passed to API method as "content_type"
+    keyword argument instead of parsing of PATH_INFO. The registry itself
+    is a WSGI application. Unknown URLs and not allowed HTTP methods are
+    responded by API errors in content type of URL's extension:
+
+        api = Registry()
+
+        @api.route('/products/<int:id>')
+        @api_method('get', ('json', 'xml'))
+        def product(request, id, content_type):
+            ...
+
+        api.add('/vendors', VendorsApi)
+
+        if __name__ == '__main__':
+            api.serve(port=8000, processes=4)
+    """
+    def __init__(self, prefix=''):
+        self.prefix = prefix
+        self._views = []
+        self._map = None
+
+    def add(self, rule, view, content_types=None, http_methods=None):
+        """
+        Registers API method: function decorated by "api_method" or
+        ApiMethod's child class. "Rule" is a Werkzeug's rule without content
+        type extension.
+        """
+        if isinstance(view, type) and issubclass(view, ApiMethod):
+            content_types = content_types or view.content_types
+            view = view.view
+        else:
+            content_types = content_types or view.content_types
+            http_methods = http_methods or getattr(view, 'http_methods', None)
+        if http_methods:
+            http_methods = [method.upper() for method in http_methods]
+        self._views.append((self.prefix + rule, view, content_types,
+                            http_methods))
+        self._map = None
+
+    def route(self, rule, **options):
+        """
+        Decorator registering API method function.
+        """
+        def decorator(view):
+            self.add(rule, view, **options)
+            return view
+        return decorator
+
+    @property
+    def url_map(self):
+        """
+        Werkzeug's URL map compiled on first request.
+        """
+        if self._map is None:
+            from werkzeug.routing import Map, Rule
+
+            rules = []
+            for endpoint, (rule, _, content_types, http_methods) in \
+                    enumerate(self._views):
+                for content_type in content_types:
+                    rules.append(Rule(
+                        '%s.%s' % (rule, content_type),
+                        endpoint=endpoint,
+                        defaults={'content_type': content_type},
+                        methods=http_methods,
+                    ))
+            self._map = Map(rules, redirect_defaults=False)
+        return self._map
+
+    def __call__(self, environ, start_response):
+        from werkzeug.exceptions import HTTPException, MethodNotAllowed, \
+            NotFound
+        from werkzeug.wrappers import Request
+
+        adapter = self.url_map.bind_to_environ(environ)
+        try:
+            endpoint, values = adapter.match()
+        except NotFound:
+            response = _http_error(
+                404, 'Not Found', _content_type(environ)
+            )
+        except MethodNotAllowed as e:
+            response = _method_not_allowed(
+                e.valid_methods, _content_type(environ)
+            )
+        except HTTPException as e:
+            return e(environ, start_response)
+        else:
+            response = self._views[endpoint][1](Request(environ), **values)
+        return response(environ, start_response)
+
+    def serve(self, host='127.0.0.1', port=8000, processes=1, **options):
+        """
+        Runs the registry by Werkzeug's server in "processes" processes
+        (or in threads of a single process by default).
+        """
+        from werkzeug.serving import run_simple
+
+        options.setdefault('threaded', processes == 1)
+        run_simple(host, port, self, processes=processes, **options)
+
+
+def _content_type(environ):
+    """
+    Returns serializable content type by extension of requested URL or
+    None.
+    """
+    content_type = path.splitext(environ.get('PATH_INFO', ''))[1][1:]
+    if content_type in _serializers:
+        return content_type
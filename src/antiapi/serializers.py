@@ -1,23 +1,219 @@
 # coding: utf-8
 
+from array import array
 from decimal import Decimal
+from itertools import izip
 from json import JSONEncoder
-try:
-    from inflect import engine
-    inflector = engine()
-except ImportError:
-    # TODO: make right error for XML serializer or graceful degradation.
-    inflector = lambda x: x
+import re
+import sys
+from threading import local
+from uuid import UUID, uuid4
+
+from .cache import LocalCache
+
+
+_inflector = None
+
+
+def singular_noun(word):
+    """
+    Returns singular form of a plural noun or False if "word" isn't a plural
+    noun or "inflect" isn't installed. "Inflect" is imported on first call,
+    because it's slow to import and needed for XML only.
+    """
+    global _inflector
+    if _inflector is None:
+        try:
+            from inflect import engine
+            _inflector = engine()
+        except ImportError:
+            _inflector = False
+    if _inflector:
+        return _inflector.singular_noun(word)
+    return False
+
+
+# NumPy part. NumPy is optional and never imported here: objects of its
+# types can exist only if it's already imported by application.
+
+def _numpy(obj):
+    """
+    Returns numpy module if "obj" is NumPy's array (including record and
+    other arrays' subclasses) or scalar.
+    """
+    np = sys.modules.get('numpy')
+    if np is not None and isinstance(obj, (np.ndarray, np.generic)):
+        return np
+
+
+def is_ndarray(obj):
+    np = _numpy(obj)
+    return np is not None and isinstance(obj, np.ndarray)
+
+
+def ndarray_rows(arr):
+    """
+    Converts NumPy array to list (structured arrays to list of dicts) by
+    "tolist", so every value still becomes a Python object (and every row
+    of structured array a dict). It's a convenience for serializers, not
+    an optimization: per-element overhead isn't removed.
+    """
+    names = arr.dtype.names
+    if not names:
+        return arr.tolist()
+    columns = [arr[name].tolist() for name in names]
+    return [dict(izip(names, row)) for row in izip(*columns)]
+
+
+def _from_numpy(obj):
+    """
+    Converts NumPy's arrays and scalars to Python's types or returns None
+    for other objects.
+    """
+    np = _numpy(obj)
+    if np is None:
+        return None
+    if isinstance(obj, np.ndarray):
+        return ndarray_rows(obj)
+    if isinstance(obj, np.generic):
+        return obj.item()
+
+
+# Sparse fieldsets part.
+
+def _fields_tree(fields):
+    """
+    Converts list of fields' paths like ['id', 'vendor.name'] to a tree
+    like {'id': None, 'vendor': {'name': None}}, where None means the whole
+    value.
+    """
+    tree = {}
+    for field in fields:
+        node = tree
+        parts = field.split('.')
+        for part in parts[:-1]:
+            if node.get(part, {}) is None:
+                # The whole value is already selected.
+                break
+            node = node.setdefault(part, {})
+        else:
+            node[parts[-1]] = None
+    return tree
+
+
+def _select(obj, tree):
+    if hasattr(obj, 'iteritems'):
+        selected = {
+            key: obj[key] if subtree is None else _select(obj[key], subtree)
+            for key, subtree in tree.iteritems()
+            if key in obj
+        }
+        # Keep attributes, text and tags' names for XML serializer.
+        for key in obj:
+            if _is_xml_control_key(key) and key not in selected:
+                selected[key] = obj[key]
+        return selected
+    if isinstance(obj, (list, tuple)):
+        return [_select(item, tree) for item in obj]
+    return obj
+
+
+def _is_xml_control_key(key):
+    return isinstance(key, basestring) and \
+        (key[:1] in ('@', '#') or key == 'text()')
+
+
+def select_fields(obj, fields):
+    """
+    Returns data with only given fields of dicts (including dicts in
+    lists). Nested fields are specified by paths like "vendor.name".
+    XML attributes ("@name"), text ("text()") and other keys starting with
+    "#" are always kept.
+    """
+    return _select(obj, _fields_tree(fields))
+
+
+# Fragments part.
+
+class Fragment(object):
+    """
+    Sub-object of response which serialized text is cached by "key" and
+    spliced into responses as is, e.g.:
+
+        {'vendor': Fragment(('vendor', vendor.id, vendor.version),
+                            lambda: vendor_data(vendor))}
+
+    Key must change with data (include a version or modification time) or
+    fragment must be invalidated by "invalidate_fragment". "Data" can be
+    a callable, then it's called only if fragment isn't cached. Any object
+    with "fragment_key" attribute and "fragment_data" method is serialized
+    the same way. Fields selection isn't applied to fragments.
+    """
+    __slots__ = ('fragment_key', '_data')
+
+    def __init__(self, key, data):
+        self.fragment_key = key
+        self._data = data
+
+    def fragment_data(self):
+        if callable(self._data):
+            return self._data()
+        return self._data
+
+
+# Cache of serialized fragments: {key: {variant: serialized text}}.
+fragments_cache = LocalCache(max_size=10000, ttl=3600)
+
+
+def invalidate_fragment(key):
+    """
+    Drops all serialized forms of fragment with given key.
+    """
+    fragments_cache.delete(key)
+
+
+def _cached_fragment(obj, variant, serialize):
+    variants = fragments_cache.get(obj.fragment_key)
+    if variants is None:
+        variants = {}
+    elif variant in variants:
+        return variants[variant]
+    value = variants[variant] = serialize(obj.fragment_data())
+    fragments_cache.set(obj.fragment_key, variants)
+    return value
 
 
 # JSON serialization part.
 
+# JSON encoder can't output raw text, so fragments are encoded as strings
+# with a mark and then are replaced by their cached text.
+_FRAGMENT_ID = uuid4().hex[:8]
+_FRAGMENT_MARK = u'\x00%s:' % _FRAGMENT_ID
+_fragment_re = re.compile(r'"\\u0000%s:(\d+)"' % _FRAGMENT_ID)
+# Stack of fragments lists of encoding calls in current thread.
+_state = local()
+
+
 def _json_extra(obj, *arg, **kwargs):
     """
     Serialized extra data types to JSON.
     """
     if isinstance(obj, Decimal):
         return str(obj)
+    if isinstance(obj, array):
+        # E.g. validated list parameters.
+        return obj.tolist()
+    if isinstance(obj, UUID):
+        return str(obj)
+    if hasattr(obj, 'fragment_key'):
+        fragments, is_pretty = _state.stack[-1]
+        fragments.append(_cached_fragment(
+            obj, ('json', is_pretty), lambda data: _encode(data, is_pretty)
+        ))
+        return _FRAGMENT_MARK + str(len(fragments) - 1)
+    value = _from_numpy(obj)
+    if value is not None:
+        return value
     # datetime stuff
     if hasattr(obj, 'isoformat'):
         return obj.isoformat()
@@ -35,20 +231,66 @@ pretty_encoder = JSONEncoder(
 )
 
 
-def to_json(obj, is_pretty=False):
+def to_json(obj, is_pretty=False, fields=None):
     """
-    JSON serialization shortcut function.
+    JSON serialization shortcut function. Returns string encoded in UTF-8.
     """
-    if is_pretty:
-        return pretty_encoder.encode(obj)
-    return encoder.encode(obj)
+    if fields:
+        obj = select_fields(obj, fields)
+    return _to_bytes(_encode(obj, is_pretty))
+
+
+def _to_bytes(text):
+    if isinstance(text, unicode):
+        return text.encode('utf-8')
+    return text
+
+
+def _encode(obj, is_pretty):
+    stack = getattr(_state, 'stack', None)
+    if stack is None:
+        stack = _state.stack = []
+    fragments = []
+    stack.append((fragments, is_pretty))
+    try:
+        if is_pretty:
+            text = pretty_encoder.encode(obj)
+        else:
+            text = encoder.encode(obj)
+    finally:
+        stack.pop()
+    if fragments:
+        if is_pretty:
+            text = _fragment_re.sub(
+                lambda m: _indent(fragments[int(m.group(1))], text, m.start()),
+                text
+            )
+        else:
+            text = _fragment_re.sub(
+                lambda m: fragments[int(m.group(1))], text
+            )
+    return text
 
 
-def to_jsonp(obj, jsonp_callback='callback', is_pretty=False):
+def _indent(fragment, text, pos):
     """
-    JSONP serialization shortcut function.
+    Indents lines of pretty fragment by indentation of the line of "text"
+    it's spliced into at "pos" (fragments are cached at top level).
     """
-    return '%s(%s);' % (jsonp_callback, to_json(obj, is_pretty))
+    line = text[text.rfind('\n', 0, pos) + 1:pos]
+    indent = line[:len(line) - len(line.lstrip(' '))]
+    if not indent:
+        return fragment
+    return fragment.replace('\n', '\n' + indent)
+
+
+def to_jsonp(obj, jsonp_callback='callback', is_pretty=False, fields=None):
+    """
+    JSONP serialization shortcut function. Returns string encoded in UTF-8.
+    """
+    return '%s(%s);' % (
+        _to_bytes(jsonp_callback), to_json(obj, is_pretty, fields)
+    )
 
 
 # XML serialization part.
@@ -77,6 +319,16 @@ def _serialize(obj, parent_name):
     if isinstance(obj, unicode):
         return _escape(obj.encode('utf-8')), ''
 
+    value = _from_numpy(obj)
+    if value is not None:
+        return _serialize(value, parent_name)
+
+    if hasattr(obj, 'fragment_key'):
+        return _cached_fragment(
+            obj, ('xml', parent_name),
+            lambda data: _serialize(data, parent_name)
+        )
+
     # Serialize dict stuff.
     if hasattr(obj, 'iteritems'):
         res = ''
@@ -111,7 +363,7 @@ def _serialize(obj, parent_name):
             '#name' in obj[0]
         if not is_tags_list:
             # A bit morphological magic to get tag name for list item.
-            item_name = inflector.singular_noun(parent_name) or 'item'
+            item_name = singular_noun(parent_name) or 'item'
         res = ''
         for value in obj:
             if is_tags_list:
@@ -145,11 +397,13 @@ def _serialize(obj, parent_name):
 
 
 def to_xml(obj, xml_root_node=None, serializer=None, inc_header=True,
-           is_pretty=False):
+           is_pretty=False, fields=None):
     """
-    XML serialization shortcut function.
+    XML serialization shortcut function. Returns string encoded in UTF-8.
     """
-    node_name = xml_root_node or 'root'
+    if fields:
+        obj = select_fields(obj, fields)
+    node_name = _dict_key(xml_root_node or 'root')
     value, attrs = (serializer or _serialize)(obj, node_name)
     return (
         '%s<%s%s>%s</%s>' % (
@@ -0,0 +1,13 @@
+from django.db import models
+
+from antiapi.models import AuthKeyMixin
+
+
+class Product(models.Model):
+    name = models.CharField(max_length=100)
+    price = models.IntegerField(default=0)
+
+
+class AuthKey(AuthKeyMixin, models.Model):
+    key = models.CharField(max_length=64, unique=True, blank=True)
+    name = models.CharField(max_length=100, blank=True)
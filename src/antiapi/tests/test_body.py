@@ -0,0 +1,99 @@
+from json import loads
+from StringIO import StringIO
+from unittest.case import TestCase
+
+from antiapi.body import JsonBody
+from antiapi.errors import PayloadTooLargeError, \
+    UnsupportedMediaTypeError, ValidationError
+from antiapi.method import api_method
+from antiapi.tests.utils import WerkzeugTestCase
+
+
+class _Request(object):
+    def __init__(self, body, content_type='application/json',
+                 content_length=True):
+        self.environ = {'CONTENT_TYPE': content_type}
+        if content_length:
+            self.environ['CONTENT_LENGTH'] = str(len(body))
+        self.stream = StringIO(body)
+
+
+class TestJsonBody(TestCase):
+    def test_data(self):
+        body = JsonBody(
+            _Request('{"ids": [1, 2]}', 'application/json; charset=utf-8')
+        )
+        self.assertEqual(body.data, {'ids': [1, 2]})
+        self.assertEqual(JsonBody(_Request(' ')).data, None)
+        self.assertEqual(JsonBody(_Request('', '')).data, None)
+
+    def test_malformed(self):
+        try:
+            JsonBody(_Request('{"ids": [1, 2}')).data
+        except ValidationError as e:
+            self.assertEqual((e.key, e.code), ('body', 'json'))
+        else:
+            self.fail('ValidationError is not raised')
+
+    def test_size(self):
+        data = '[%s]' % ', '.join(['1'] * 10)
+        self.assertEqual(len(JsonBody(_Request(data), len(data)).data), 10)
+        self.assertRaises(
+            PayloadTooLargeError, getattr,
+            JsonBody(_Request(data), len(data) - 1), 'data'
+        )
+        # Body without Content-Length is read up to the limit.
+        self.assertRaises(
+            PayloadTooLargeError, getattr,
+            JsonBody(_Request(data, content_length=False), 10), 'data'
+        )
+
+    def test_content_type(self):
+        body = JsonBody(_Request('a=1', 'application/x-www-form-urlencoded'))
+        self.assertRaises(UnsupportedMediaTypeError, getattr, body, 'data')
+        self.assertRaises(UnsupportedMediaTypeError, list, body)
+        self.assertRaises(
+            UnsupportedMediaTypeError, list, JsonBody(_Request('{}'))
+        )
+
+    def test_ndjson(self):
+        request = _Request(
+            '{"id": 1}\n\n{"id": 2}\n{"id": 3}', 'application/x-ndjson'
+        )
+        records = iter(JsonBody(request))
+        self.assertEqual(next(records), {'id': 1})
+        # Records are read one by one.
+        self.assertEqual(request.stream.tell(), 10)
+        self.assertEqual(list(records), [{'id': 2}, {'id': 3}])
+
+    def test_ndjson_size(self):
+        # The longest record has 13 bytes without line break.
+        data = '{"id": 1}\n{"id": 12345}\n'
+        self.assertEqual(
+            len(list(JsonBody(_Request(data, 'application/x-ndjson'), 13))),
+            2
+        )
+        self.assertRaises(PayloadTooLargeError, list, JsonBody(
+            _Request(data, 'application/x-ndjson'), 12
+        ))
+        self.assertRaises(PayloadTooLargeError, list, JsonBody(
+            _Request(data, 'application/x-ndjson', False), 100, 20
+        ))
+
+
+class TestApiMethodBody(WerkzeugTestCase):
+    def test(self):
+        @api_method('post', 'json', max_body_size=20)
+        def echo(request):
+            return request.json_body.data
+
+        for data, content_type, status in (
+                ('{"id": 1}', 'application/json', 200),
+                ('{"id": 1', 'application/json', 400),
+                ('{"ids": [1, 2, 3, 4, 5]}', 'application/json', 413),
+                ('id=1', 'application/x-www-form-urlencoded', 415)):
+            response = echo(self.request(
+                '/echo.json', 'POST', data=data, content_type=content_type
+            ))
+            self.assertEqual(response.status_code, status)
+            self.assertTrue(loads(response.get_data()))
@@ -0,0 +1,97 @@
+from threading import Thread
+from time import sleep
+from unittest.case import TestCase
+
+from antiapi.cache import LocalCache, SingleFlight
+
+
+class TestLocalCache(TestCase):
+    def test_lru(self):
+        cache = LocalCache(max_size=2)
+        cache.set('a', 1)
+        cache.set('b', 2)
+        self.assertEqual(cache.get('a'), 1)
+        cache.set('c', 3)
+        # "b" is the least recently used key.
+        self.assertEqual(cache.get('b'), None)
+        self.assertEqual(cache.get('a'), 1)
+        self.assertEqual(cache.get('c'), 3)
+
+    def test_ttl(self):
+        cache = LocalCache()
+        cache.set('a', 1, ttl=-1)
+        self.assertEqual(cache.get('a', 'default'), 'default')
+
+    def test_delete(self):
+        cache = LocalCache()
+        cache.set('a', 1)
+        cache.delete('a')
+        cache.delete('b')
+        self.assertEqual(cache.get('a'), None)
+
+
+class TestSingleFlight(TestCase):
+    def test_concurrent_calls(self):
+        flight = SingleFlight()
+        calls = []
+        results = []
+
+        def load():
+            calls.append(1)
+            sleep(0.1)
+            return 'value'
+
+        threads = [
+            Thread(target=lambda: results.append(flight.do('key', load)))
+            for _ in range(5)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(results, ['value'] * 5)
+
+    def test_error(self):
+        flight = SingleFlight()
+        calls = []
+        errors = []
+
+        def fail():
+            calls.append(1)
+            sleep(0.1)
+            raise ValueError('error')
+
+        def call():
+            try:
+                flight.do('key', fail)
+            except ValueError as e:
+                errors.append(e)
+
+        threads = [Thread(target=call) for _ in range(3)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(len(calls), 1)
+        # Every waiter gets the error.
+        self.assertEqual(len(errors), 3)
+
+    def test_timeout(self):
+        flight = SingleFlight(timeout=0.05)
+        calls = []
+
+        def load():
+            calls.append(1)
+            sleep(0.2)
+            return 'value'
+
+        results = []
+        thread = Thread(target=lambda: results.append(flight.do('key', load)))
+        thread.start()
+        sleep(0.01)
+        results.append(flight.do('key', load))
+        thread.join()
+        # Waiter has called the function itself after timeout.
+        self.assertEqual(len(calls), 2)
+        self.assertEqual(results, ['value'] * 2)
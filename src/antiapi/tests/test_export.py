@@ -0,0 +1,288 @@
+import os
+from shutil import rmtree
+import sqlite3
+from StringIO import StringIO
+from tempfile import mkdtemp
+from threading import Thread
+from time import sleep
+from zlib import decompress, MAX_WBITS
+from unittest import skipIf
+from unittest.case import TestCase
+
+from antiapi.export import CursorSource, Exporter, ExportReader, \
+    IterableSource, KeysetQuerySetSource, RowSource, export_response, \
+    export_source, iter_export
+from antiapi.method import api_method
+from antiapi.tests.utils import WerkzeugTestCase, setup_django
+
+has_django = setup_django()
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+
+class TestSources(TestCase):
+    def test_iterable(self):
+        source = IterableSource(({'id': i} for i in xrange(5)), batch_size=2)
+        self.assertEqual(
+            [len(batch) for batch in source.batches()], [2, 2, 1]
+        )
+
+    def test_cursor(self):
+        connection = sqlite3.connect(':memory:')
+        connection.execute('CREATE TABLE product (id INTEGER, name TEXT)')
+        connection.executemany(
+            'INSERT INTO product VALUES (?, ?)',
+            [(i, u'Product %d' % i) for i in xrange(5)]
+        )
+        cursor = connection.execute('SELECT id, name FROM product ORDER BY id')
+        batches = list(CursorSource(cursor, batch_size=2).batches())
+        self.assertEqual([len(batch) for batch in batches], [2, 2, 1])
+        self.assertEqual(batches[0][1], {'id': 1, 'name': u'Product 1'})
+
+        cursor = connection.execute('SELECT id FROM product ORDER BY id')
+        rows = list(CursorSource(cursor, as_dict=False))
+        self.assertEqual([row[0] for row in rows], range(5))
+
+    def test_abstract(self):
+        self.assertRaises(NotImplementedError, list, RowSource())
+
+    @skipIf(not has_django, 'Django is not installed')
+    def test_keyset_queryset(self):
+        from antiapi.tests.models import Product
+
+        Product.objects.all().delete()
+        Product.objects.bulk_create(
+            [Product(name='Product %d' % i, price=i) for i in xrange(5)]
+        )
+        qs = Product.objects.filter(price__gt=0).values('id', 'price')
+        batches = list(KeysetQuerySetSource(qs, batch_size=2).batches())
+        self.assertEqual([len(batch) for batch in batches], [2, 2])
+        self.assertEqual(
+            [row['price'] for batch in batches for row in batch], [1, 2, 3, 4]
+        )
+        for qs in (Product.objects.filter(price__gt=0),
+                   Product.objects.filter(price__gt=0).values('pk', 'name')):
+            self.assertEqual(
+                len(list(KeysetQuerySetSource(qs, batch_size=3))), 4
+            )
+        # Primary key must be selected before anything is exported.
+        for qs in (Product.objects.values('name'),
+                   Product.objects.values_list('id', 'name')):
+            self.assertRaises(ValueError, KeysetQuerySetSource, qs)
+            self.assertRaises(ValueError, iter_export, qs, 'json')
+
+
+class TestExportSource(TestCase):
+    def export(self, rows, batch_size, limit):
+        output = StringIO()
+        exporter = Exporter()
+        exporter.add_file('rows', 'ndjson', fileobj=output)
+        count = export_source(
+            exporter, IterableSource(rows, batch_size), limit=limit
+        )
+        return count, output.getvalue().splitlines()
+
+    def test(self):
+        rows = [{'id': i} for i in xrange(5)]
+        count, lines = self.export(rows, 2, None)
+        self.assertEqual(count, 5)
+        self.assertEqual(lines, ['{"id": %d}' % i for i in xrange(5)])
+
+    def test_limit(self):
+        rows = [{'id': i} for i in xrange(10)]
+        for limit in (1, 3, 4, 10, 20):
+            count, lines = self.export(rows, 3, limit)
+            self.assertEqual(count, min(limit, 10))
+            self.assertEqual(len(lines), count)
+
+    @skipIf(numpy is None, 'NumPy is not installed')
+    def test_csv_numpy(self):
+        dtype = [('id', 'i8'), ('name', 'S10')]
+        rows = [(1, 'a'), (2, 'b"')]
+        for arr in (numpy.array(rows, dtype), numpy.rec.array(rows, dtype)):
+            output = StringIO()
+            exporter = Exporter()
+            exporter.csv_fields_order = ('id', 'name')
+            exporter.add_file('rows', 'csv', fileobj=output)
+            export_source(exporter, [arr, {'id': 3, 'name': 'c'}, arr[:0]])
+            self.assertEqual(
+                output.getvalue(),
+                '"1","a"\r\n"2","b"""\r\n"3","c"'
+            )
+        arr = numpy.array(
+            [(1.5, True, u'\u0430"', None)],
+            [('price', 'f8'), ('active', '?'), ('name', 'U2'), ('note', 'O')]
+        )
+        output = StringIO()
+        exporter = Exporter()
+        exporter.csv_fields_order = ('price', 'active', 'name', 'note')
+        exporter.add_file('rows', 'csv', fileobj=output)
+        export_source(exporter, [arr])
+        self.assertEqual(
+            output.getvalue(), '"1.5","True","\xd0\xb0""","None"'
+        )
+
+
+def _product_id(product):
+    return product['id']
+
+
+class TestExportReader(TestCase):
+    def setUp(self):
+        self.directory = mkdtemp()
+        self.filename = os.path.join(self.directory, 'products.jsono')
+        exporter = Exporter()
+        exporter.add_file(self.filename, 'jsono')
+        export_source(exporter, (
+            {'id': i, 'name': u'Product %d' % i} for i in xrange(10)
+        ))
+
+    def tearDown(self):
+        rmtree(self.directory)
+
+    def test(self):
+        with ExportReader(self.filename) as products:
+            self.assertEqual(len(products), 10)
+            self.assertEqual(products[0], {'id': 0, 'name': u'Product 0'})
+            self.assertEqual(products[-1]['id'], 9)
+            self.assertEqual(
+                [product['id'] for product in products[3:9:2]], [3, 5, 7]
+            )
+            self.assertEqual(products[8:20], list(products)[8:])
+            self.assertRaises(IndexError, lambda: products[10])
+
+    def test_index(self):
+        with ExportReader(self.filename) as products:
+            offsets = products.offsets
+        self.assertTrue(os.path.exists(self.filename + '.idx'))
+        with ExportReader(self.filename) as products:
+            self.assertEqual(products._load_index(), offsets)
+            self.assertEqual(products[5]['id'], 5)
+        # Index of changed file isn't used.
+        with open(self.filename, 'w') as f:
+            f.write('[\n{"id": 1}\n]')
+        with ExportReader(self.filename) as products:
+            self.assertEqual(list(products), [{'id': 1}])
+
+    def test_broken_index(self):
+        with ExportReader(self.filename) as products:
+            offsets = products.offsets
+        with open(self.filename + '.idx', 'rb') as f:
+            data = f.read()
+        # Partially written index.
+        with open(self.filename + '.idx', 'wb') as f:
+            f.write(data[:-1])
+        with ExportReader(self.filename) as products:
+            self.assertEqual(len(products), 10)
+        # Index truncated at item's boundary.
+        with open(self.filename + '.idx', 'wb') as f:
+            f.write(data[:-offsets.itemsize])
+        with ExportReader(self.filename, persist_index=False) as products:
+            self.assertEqual(products._load_index(), None)
+            self.assertEqual(len(products), 10)
+        self.assertEqual(
+            [name for name in os.listdir(self.directory)],
+            ['products.jsono', 'products.jsono.idx']
+        )
+
+    def test_blank_lines(self):
+        filename = os.path.join(self.directory, 'rows.ndjson')
+        with open(filename, 'w') as f:
+            f.write('\n{"a":1}\n\n{"a":2}\n{"a":3}\n\n')
+        with ExportReader(filename) as rows:
+            self.assertEqual(list(rows), [{'a': 1}, {'a': 2}, {'a': 3}])
+        with ExportReader(filename) as rows:
+            self.assertEqual(len(rows), 3)
+
+    def test_map_chunks(self):
+        with ExportReader(self.filename) as products:
+            self.assertEqual(
+                list(products.map_chunks(_product_id, 3, processes=2)),
+                range(10)
+            )
+
+    def test_csv(self):
+        filename = os.path.join(self.directory, 'rows.csv')
+        with open(filename, 'w') as f:
+            f.write(',"a"\r\n"b\r\nc",\r\n')
+        with ExportReader(filename, persist_index=False) as rows:
+            self.assertEqual(list(rows), [[u'', u'a'], [u'b\r\nc', u'']])
+
+
+class TestIterExport(TestCase):
+    def test_shared_exporter(self):
+        exporter = Exporter()
+        exporter.csv_fields_order = ('id', )
+        rows = [{'id': i} for i in xrange(3)]
+        first = iter_export(IterableSource(rows, 2), 'csv', exporter)
+        second = iter_export(IterableSource(rows, 2), 'csv', exporter)
+        # Concurrent exports don't affect each other.
+        chunks = [next(first), next(second), next(second), next(first)]
+        self.assertEqual(chunks, ['"0"\r\n"1"', '"0"\r\n"1"'] + [
+            '\r\n"2"'
+        ] * 2)
+        self.assertEqual(''.join(first), '')
+        self.assertEqual(
+            ''.join(iter_export(rows, 'csv', exporter)), '"0"\r\n"1"\r\n"2"'
+        )
+        self.assertEqual(exporter.files, None)
+
+    def test_compress(self):
+        chunks = list(iter_export(
+            ({'id': i} for i in xrange(1000)), 'json', compress=True
+        ))
+        self.assertEqual(
+            decompress(''.join(chunks), MAX_WBITS | 16),
+            '[%s]' % ','.join('{"id": %d}' % i for i in xrange(1000))
+        )
+
+
+class TestExportResponse(WerkzeugTestCase):
+    def test_coalesce(self):
+        calls = []
+
+        @api_method('get', 'json', coalesce=True)
+        def products(request):
+            calls.append(1)
+            sleep(0.1)
+            return export_response(
+                request, [{'id': 1}], 'ndjson', filename='products.ndjson'
+            )
+
+        responses = []
+        threads = [
+            Thread(target=lambda: responses.append(
+                products(self.request('/products.json'))
+            ))
+            for _ in xrange(3)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        # Streaming response isn't shared.
+        self.assertEqual(len(calls), 3)
+        for response in responses:
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(
+                response.headers['Content-Type'], 'application/x-ndjson'
+            )
+            self.assertEqual(
+                response.headers['Content-Disposition'],
+                'attachment; filename="products.ndjson"'
+            )
+            self.assertEqual(''.join(response.response), '{"id": 1}\n')
+
+    def test_gzip(self):
+        response = export_response(
+            self.request('/p.json', headers={'Accept-Encoding': 'gzip'}),
+            [{'id': 1}], 'jsono'
+        )
+        self.assertEqual(response.headers['Content-Encoding'], 'gzip')
+        self.assertEqual(
+            decompress(''.join(response.response), MAX_WBITS | 16),
+            '[\n{"id": 1}\n]'
+        )
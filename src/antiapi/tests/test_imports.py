@@ -0,0 +1,69 @@
+from os import path
+from subprocess import check_output
+import sys
+from unittest import skipIf
+from unittest.case import TestCase
+
+try:
+    import django
+except ImportError:
+    django = None
+
+# Budget of importing all antiapi modules in a clean interpreter.
+MAX_IMPORT_TIME = 0.5
+MAX_IMPORTED_MODULES = 100
+
+# Heavy modules must be imported on demand only.
+LAZY_MODULES = ('django', 'werkzeug', 'inflect', 'numpy', 'multiprocessing')
+
+# Modules which don't depend on web framework.
+MODULES = (
+    'antiapi.method', 'antiapi.serializers', 'antiapi.validation',
+    'antiapi.export', 'antiapi.pagination', 'antiapi.throttling',
+    'antiapi.body', 'antiapi.routing', 'antiapi.profiling',
+)
+
+_SCRIPT = '''
+import sys
+from time import time
+before = set(name for name, module in sys.modules.items() if module)
+start = time()
+for name in sys.argv[1:]:
+    __import__(name)
+duration = time() - start
+print(duration)
+for name, module in sys.modules.items():
+    if module and name not in before:
+        print(name)
+'''
+
+
+def _import(*modules):
+    """
+    Imports modules in a clean interpreter and returns duration of import
+    and list of all imported modules.
+    """
+    src = path.dirname(path.dirname(path.dirname(path.abspath(__file__))))
+    output = check_output(
+        (sys.executable, '-c', _SCRIPT) + modules, cwd=src
+    )
+    lines = output.split()
+    return float(lines[0]), lines[1:]
+
+
+class TestImports(TestCase):
+    def test_import_budget(self):
+        duration, modules = _import(*MODULES)
+        self.assertLess(duration, MAX_IMPORT_TIME)
+        self.assertLess(len(modules), MAX_IMPORTED_MODULES)
+        for name in modules:
+            self.assertNotIn(name.split('.')[0], LAZY_MODULES)
+
+    @skipIf(django is None, 'Django is not installed')
+    def test_models(self):
+        # Mixins of Django's models depend on Django only.
+        _, modules = _import('antiapi.models')
+        for name in modules:
+            package = name.split('.')[0]
+            if package != 'django':
+                self.assertNotIn(package, LAZY_MODULES)
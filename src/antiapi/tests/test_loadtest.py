@@ -0,0 +1,60 @@
+from multiprocessing import Process
+from StringIO import StringIO
+from unittest.case import TestCase
+
+from antiapi.loadtest import THRESHOLDS, Stats, _free_port, \
+    _wait_for_server, report
+
+
+def _exit():
+    raise SystemExit(3)
+
+
+class TestStats(TestCase):
+    def test_percentile(self):
+        stats = Stats()
+        self.assertEqual(stats.percentile(50), 0)
+        for latency in xrange(100, 0, -1):
+            stats.add(latency / 1000.0, latency != 1)
+        self.assertEqual(stats.percentile(50), 0.051)
+        self.assertEqual(stats.percentile(99), 0.1)
+        self.assertEqual(stats.percentile(100), 0.1)
+        self.assertEqual(stats.failures, 1)
+
+
+class TestReport(TestCase):
+    def stats(self, latency, failures=0):
+        stats = Stats()
+        for i in xrange(100):
+            stats.add(latency, i >= failures)
+        return {'get_json': stats}
+
+    def test(self):
+        out = StringIO()
+        self.assertEqual(report(self.stats(0.01), 1, THRESHOLDS, out), [])
+        self.assertIn('TOTAL', out.getvalue())
+        self.assertIn('Throughput: 100.0 requests/sec', out.getvalue())
+
+    def test_exceeded(self):
+        exceeded = report(self.stats(1, failures=2), 10, THRESHOLDS,
+                          StringIO())
+        self.assertEqual(exceeded, [
+            'p50 latency 1.000 sec > 0.050 sec',
+            'p95 latency 1.000 sec > 0.250 sec',
+            'p99 latency 1.000 sec > 0.500 sec',
+            'throughput 10.0 rps < 50.0 rps',
+            'failures 2.00% > 0.00%',
+        ])
+
+
+class TestWaitForServer(TestCase):
+    def test_exited(self):
+        process = Process(target=_exit)
+        process.start()
+        process.join()
+        try:
+            _wait_for_server('127.0.0.1', _free_port('127.0.0.1'), process)
+        except RuntimeError as e:
+            self.assertEqual(str(e), 'Server has exited with code 3')
+        else:
+            self.fail('RuntimeError is not raised')
@@ -0,0 +1,214 @@
+from json import loads
+from threading import Thread
+from time import sleep
+
+from antiapi import method
+from antiapi.errors import NotFoundError
+from antiapi.method import _error_bodies, _http_error, api_method, \
+    patch_request
+from antiapi.tests.utils import WerkzeugTestCase, setup_django
+from antiapi.validation import Param, validate
+
+
+class TestFields(WerkzeugTestCase):
+    def test(self):
+        requests = []
+
+        @api_method('get', 'json', allowed_fields=('id', 'vendor.name'))
+        def products(request):
+            requests.append(request)
+            return [{'id': 1, 'name': 'a', 'vendor': {'id': 2, 'name': 'b'}}]
+
+        response = products(self.request('/products.json?fields=id'))
+        self.assertEqual(loads(response.get_data()), [{'id': 1}])
+        self.assertEqual(requests[-1].fields, ['id'])
+
+        response = products(
+            self.request('/products.json?fields=id,vendor.name')
+        )
+        self.assertEqual(
+            loads(response.get_data()), [{'id': 1, 'vendor': {'name': 'b'}}]
+        )
+        self.assertEqual(requests[-1].field_lookups, ['id', 'vendor__name'])
+
+        response = products(self.request('/products.json'))
+        self.assertEqual(len(loads(response.get_data())[0]), 3)
+        self.assertEqual(requests[-1].field_lookups, None)
+
+        response = products(self.request('/products.json?fields=id,name'))
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(loads(response.get_data())['key'], 'fields')
+
+
+class TestCoalesce(WerkzeugTestCase):
+    def call_concurrently(self, view, urls, delay=0):
+        responses = []
+
+        def call(url):
+            responses.append(view(self.request(url)))
+
+        threads = []
+        for url in urls:
+            threads.append(Thread(target=call, args=(url, )))
+            threads[-1].start()
+            sleep(delay)
+        for thread in threads:
+            thread.join()
+        return responses
+
+    def test(self):
+        calls = []
+
+        @api_method('get', 'json', coalesce=True)
+        def products(request):
+            calls.append(request.args.get('page'))
+            sleep(0.1)
+            return {'page': request.args.get('page')}
+
+        responses = self.call_concurrently(
+            products,
+            ['/products.json?page=1&size=2'] * 4 +
+            ['/products.json?size=2&page=1', '/products.json?page=2']
+        )
+        self.assertEqual(sorted(calls), ['1', '2'])
+        self.assertEqual(
+            sorted(loads(response.get_data())['page']
+                   for response in responses),
+            ['1'] * 5 + ['2']
+        )
+        for response in responses:
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(
+                response.headers['Content-Type'], 'application/json'
+            )
+
+    def test_timeout(self):
+        calls = []
+
+        @api_method('get', 'json', coalesce=0.05)
+        def products(request):
+            calls.append(1)
+            sleep(0.2)
+            return []
+
+        responses = self.call_concurrently(
+            products, ['/products.json'] * 2, delay=0.01
+        )
+        # Waiter has called handler itself after timeout.
+        self.assertEqual(len(calls), 2)
+        self.assertEqual([r.status_code for r in responses], [200, 200])
+
+    def test_error(self):
+        calls = []
+
+        @api_method('get', 'json', coalesce=True)
+        def products(request):
+            calls.append(1)
+            sleep(0.1)
+            raise NotFoundError('Not found')
+
+        responses = self.call_concurrently(products, ['/products.json'] * 3)
+        self.assertEqual(len(calls), 1)
+        for response in responses:
+            self.assertEqual(response.status_code, 404)
+            self.assertEqual(
+                loads(response.get_data()), {'message': 'Not found'}
+            )
+
+
+class TestRequestParams(WerkzeugTestCase):
+    def patched(self, url, http_method, **kwargs):
+        request = self.request(url, http_method, **kwargs)
+        patch_request(request)
+        return request
+
+    def test_get(self):
+        from werkzeug.wrappers import Request
+
+        class NoBodyRequest(Request):
+            @property
+            def form(self):
+                raise AssertionError('Body must not be parsed')
+
+        request = NoBodyRequest(self.request(
+            '/p.json?a=1&a=2', 'GET', data={'b': '3'}
+        ).environ)
+        patch_request(request)
+        self.assertEqual(request.params.get('a'), '1')
+        self.assertEqual(request.params.getlist('a'), ['1', '2'])
+        self.assertEqual(request.params.get('b', 'default'), 'default')
+        self.assertEqual(request.params.getlist('b'), [])
+        self.assertNotIn('b', request.params)
+        self.assertRaises(KeyError, lambda: request.params['b'])
+
+    def test_post(self):
+        request = self.patched(
+            '/p.json?a=1', 'POST', data={'a': '2', 'b': ['3', '4']}
+        )
+        # Query string parameters are looked up first.
+        self.assertEqual(request.params['a'], '1')
+        self.assertEqual(request.params.get('b'), '3')
+        self.assertEqual(request.params.getlist('b'), ['3', '4'])
+        self.assertIn('b', request.params)
+        self.assertEqual(list(validate(
+            {'b': Param(type='int', many=True)}, request.params
+        )['b']), [3, 4])
+
+    def test_django(self):
+        if not setup_django():
+            self.skipTest('Django is not installed')
+        from django.test import RequestFactory
+
+        method._backend = None
+        factory = RequestFactory()
+        request = factory.get('/p.json?a=1')
+        patch_request(request)
+        self.assertEqual(request.params.get('a'), '1')
+        self.assertEqual(request.params.get('b'), None)
+        self.assertNotIn('_post', request.__dict__)
+        request = factory.post('/p.json?a=1', {'a': '2', 'b': '3'})
+        patch_request(request)
+        self.assertEqual(request.params['a'], '1')
+        self.assertEqual(request.params['b'], '3')
+
+
+class TestResponses(WerkzeugTestCase):
+    def test_body(self):
+        name = u'\u0442\u043e\u0432\u0430\u0440'
+
+        @api_method('get', ('json', 'xml'))
+        def product(request):
+            return {'name': name}
+
+        response = product(self.request('/product.json?_pretty=1'))
+        self.assertEqual(
+            response.headers['Content-Type'],
+            'application/json; charset=utf-8'
+        )
+        data = response.get_data()
+        self.assertEqual(loads(data), {'name': name})
+        self.assertEqual(response.headers['Content-Length'], str(len(data)))
+
+    def test_errors(self):
+        _error_bodies.clear()
+        message = u'\u043d\u0435\u0442'
+        response = _http_error(404, message, 'xml')
+        body = response.get_data()
+        self.assertEqual(
+            body,
+            '<?xml version="1.0" encoding="utf-8"?><error><message>'
+            '\xd0\xbd\xd0\xb5\xd1\x82</message></error>'
+        )
+        self.assertEqual(response.headers['Content-Length'], str(len(body)))
+        self.assertEqual(response.status_code, 404)
+        self.assertEqual(_error_bodies.get((404, message, 'xml')), body)
+        self.assertEqual(_http_error(404, message, 'xml').get_data(), body)
+        # Errors with extra data aren't cached.
+        response = _http_error(400, 'Invalid', 'json', key='id')
+        self.assertEqual(
+            loads(response.get_data()), {'message': 'Invalid', 'key': 'id'}
+        )
+        self.assertEqual(len(_error_bodies), 1)
+        response = _http_error(405, 'Method Not Allowed')
+        self.assertEqual(response.get_data(), 'Method Not Allowed')
+        self.assertEqual(response.headers['Content-Length'], '18')
@@ -0,0 +1,167 @@
+from unittest import skipIf
+from unittest.case import TestCase
+
+from antiapi.tests.utils import setup_django
+
+has_django = setup_django()
+if has_django:
+    from django.core.cache import cache
+    from django.db import connection
+    from django.test.utils import CaptureQueriesContext
+
+    from antiapi import models
+    from antiapi.models import _MISSING
+    from antiapi.tests.models import AuthKey
+
+
+@skipIf(not has_django, 'Django is not installed')
+class TestAuthKey(TestCase):
+    def setUp(self):
+        AuthKey.objects.all().delete()
+        cache.clear()
+        AuthKey._local_cache.clear()
+
+    def cached(self, key_id):
+        cache_key = AuthKey._cache_key(
+            'AuthKey', key_id, AuthKey._generation()
+        )
+        return AuthKey._local_cache.get(cache_key), cache.get(cache_key)
+
+    def test_get_key(self):
+        auth_key = AuthKey.objects.create(name='a')
+        self.assertEqual(len(auth_key.key), 43)
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(AuthKey.get_key(auth_key.pk).key, auth_key.key)
+            self.assertEqual(AuthKey.get_key(auth_key.pk).name, 'a')
+            # Local tier is empty, but Django's cache still has the key.
+            AuthKey._local_cache.clear()
+            self.assertEqual(AuthKey.get_key(auth_key.pk).key, auth_key.key)
+        self.assertEqual(len(queries), 1)
+
+    def test_negative_caching(self):
+        with CaptureQueriesContext(connection) as queries:
+            for key_id in (1, 1, 'a', 'a'):
+                self.assertRaises(ValueError, AuthKey.get_key, key_id)
+        self.assertEqual(len(queries), 1)
+        self.assertEqual(self.cached(1), (_MISSING, _MISSING))
+        self.assertEqual(self.cached('a'), (_MISSING, _MISSING))
+        # Creation of the key drops cached miss.
+        AuthKey.objects.create(id=1, name='a')
+        self.assertEqual(AuthKey.get_key(1).name, 'a')
+
+    def test_drop_cache(self):
+        auth_key = AuthKey.objects.create(name='a')
+        AuthKey.get_key(auth_key.pk)
+        AuthKey.objects.filter(pk=auth_key.pk).update(name='b')
+        self.assertEqual(AuthKey.get_key(auth_key.pk).name, 'a')
+        auth_key.drop_cache()
+        self.assertEqual(self.cached(auth_key.pk), (None, None))
+        self.assertEqual(AuthKey.get_key(auth_key.pk).name, 'b')
+
+    def test_drop_all_cache(self):
+        auth_key = AuthKey.objects.create(name='a')
+        AuthKey.get_key(auth_key.pk)
+        AuthKey.objects.filter(pk=auth_key.pk).update(name='b')
+        generation = AuthKey._generation()
+        AuthKey.drop_all_cache()
+        self.assertEqual(AuthKey._generation(), generation + 1)
+        self.assertEqual(AuthKey.get_key(auth_key.pk).name, 'b')
+
+    def test_drop_all_cache_evicted(self):
+        auth_key = AuthKey.objects.create(name='a')
+        AuthKey.get_key(auth_key.pk)
+        AuthKey.objects.filter(pk=auth_key.pk).update(name='b')
+        # Generation has been evicted, so "incr" fails.
+        cache.delete(AuthKey._generation_key('AuthKey'))
+        AuthKey.drop_all_cache()
+        self.assertGreater(AuthKey._generation(), 1)
+        self.assertEqual(AuthKey.get_key(auth_key.pk).name, 'b')
+
+    def test_generation_evicted(self):
+        auth_key = AuthKey.objects.create(name='a')
+        AuthKey.get_key(auth_key.pk)
+        AuthKey.objects.filter(pk=auth_key.pk).update(name='b')
+        AuthKey.drop_all_cache()
+        self.assertEqual(AuthKey.get_key(auth_key.pk).name, 'b')
+        AuthKey.objects.filter(pk=auth_key.pk).update(name='c')
+        AuthKey.drop_all_cache()
+        # Eviction of generation doesn't bring back keys cached by any of
+        # previous generations.
+        cache.delete(AuthKey._generation_key('AuthKey'))
+        AuthKey._local_cache.clear()
+        self.assertEqual(AuthKey.get_key(auth_key.pk).name, 'c')
+
+    def test_warm_cache(self):
+        key_ids = [AuthKey.objects.create().pk for _ in xrange(3)]
+        with CaptureQueriesContext(connection) as queries:
+            AuthKey.warm_cache(key_ids + [1000])
+            for key_id in key_ids:
+                self.assertEqual(AuthKey.get_key(key_id).pk, key_id)
+            self.assertRaises(ValueError, AuthKey.get_key, 1000)
+        self.assertEqual(len(queries), 1)
+
+    def test_warm_cache_malformed(self):
+        key_id = AuthKey.objects.create().pk
+        AuthKey.warm_cache([key_id, 'a'])
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(AuthKey.get_key(key_id).pk, key_id)
+            self.assertRaises(ValueError, AuthKey.get_key, 'a')
+        self.assertEqual(len(queries), 0)
+        self.assertEqual(self.cached('a'), (_MISSING, _MISSING))
+
+    def test_bulk_create_keys(self):
+        AuthKey.objects.create(key='existing')
+        keys = iter(['k1', 'k1', 'existing', 'k1', 'k2', 'existing', 'k3'])
+        keygen = models.keygen
+        models.keygen = lambda: next(keys)
+        try:
+            auth_keys = AuthKey.bulk_create_keys(3, batch_size=2, name='b')
+        finally:
+            models.keygen = keygen
+        self.assertEqual(
+            sorted(auth_key.key for auth_key in auth_keys), ['k1', 'k2', 'k3']
+        )
+        self.assertEqual(
+            sorted(AuthKey.objects.filter(name='b').values_list(
+                'key', flat=True
+            )),
+            ['k1', 'k2', 'k3']
+        )
+
+    def test_bulk_create_keys_retries(self):
+        AuthKey.objects.create(key='existing')
+        keygen = models.keygen
+        models.keygen = lambda: 'existing'
+        try:
+            self.assertRaises(AssertionError, AuthKey.bulk_create_keys, 1)
+        finally:
+            models.keygen = keygen
+        self.assertEqual(AuthKey.objects.count(), 1)
+
+    def test_serialize(self):
+        auth_key = AuthKey.objects.create(name=u'\u0430')
+        data = auth_key.serialize()
+        self.assertEqual(data[1:], (auth_key.pk, auth_key.key, u'\u0430'))
+        restored = AuthKey.deserialize(data)
+        self.assertEqual(
+            (restored.pk, restored.key, restored.name),
+            (auth_key.pk, auth_key.key, auth_key.name)
+        )
+        self.assertEqual(restored._state.db, 'default')
+        self.assertFalse(restored._state.adding)
+        restored.name = 'b'
+        restored.save()
+        self.assertEqual(AuthKey.objects.get().name, 'b')
+
+    def test_stale_signature(self):
+        auth_key = AuthKey.objects.create(name='a')
+        data = (auth_key.serialize()[0] + 1, auth_key.pk, 'k', 'b')
+        self.assertEqual(AuthKey.deserialize(data), None)
+        cache.set(AuthKey._cache_key(
+            'AuthKey', auth_key.pk, AuthKey._generation()
+        ), data)
+        self.assertEqual(AuthKey.get_key(auth_key.pk).name, 'a')
+
+    def test_legacy_payload(self):
+        auth_key = AuthKey.deserialize({'id': 1, 'key': 'k', 'name': 'a'})
+        self.assertEqual((auth_key.pk, auth_key.key), (1, 'k'))
@@ -0,0 +1,92 @@
+from unittest import skipIf
+from unittest.case import TestCase
+from uuid import UUID
+
+from antiapi.errors import ValidationError
+from antiapi.pagination import cursor_param, decode_cursor, encode_cursor, \
+    paginate
+from antiapi.tests.utils import setup_django
+from antiapi.validation import validate
+
+has_django = setup_django()
+
+ORDERING = ('-name', 'pk')
+
+
+class TestCursor(TestCase):
+    def test(self):
+        cursor = encode_cursor([u'a', 1], ORDERING, 'secret')
+        self.assertEqual(decode_cursor(cursor, ORDERING, 'secret'), [u'a', 1])
+        self.assertEqual(
+            decode_cursor(unicode(cursor), ORDERING, 'secret'), [u'a', 1]
+        )
+
+    def test_uuid(self):
+        value = UUID('12345678123456781234567812345678')
+        cursor = encode_cursor([u'a', value], ORDERING, 'secret')
+        self.assertEqual(
+            decode_cursor(cursor, ORDERING, 'secret'), [u'a', unicode(value)]
+        )
+
+    def test_invalid(self):
+        cursor = encode_cursor([u'a', 1], ORDERING, 'secret')
+        tampered = cursor[:-2] + ('AA' if cursor[-2:] != 'AA' else 'BB')
+        for args in ((tampered, ORDERING, 'secret'),
+                     (cursor, ORDERING, 'another secret'),
+                     (cursor, ('name', 'pk'), 'secret'),
+                     (u'\u0430', ORDERING, 'secret'),
+                     ('a', ORDERING, 'secret')):
+            try:
+                decode_cursor(*args)
+            except ValidationError as e:
+                self.assertEqual((e.key, e.code), ('cursor', 'value'))
+            else:
+                self.fail('ValidationError is not raised for %r' % (args, ))
+
+    def test_param(self):
+        params = {'cursor': cursor_param(ORDERING, 'secret')}
+        cursor = encode_cursor([u'a', 1], ORDERING, 'secret')
+        self.assertEqual(validate(params, {'cursor': cursor}), {
+            'cursor': cursor
+        })
+        self.assertRaises(
+            ValidationError, validate, params, {'cursor': cursor + 'a'}
+        )
+
+
+@skipIf(not has_django, 'Django is not installed')
+class TestPaginate(TestCase):
+    def setUp(self):
+        from antiapi.tests.models import Product
+
+        Product.objects.all().delete()
+        # Names are not unique, so order is defined by primary key too.
+        Product.objects.bulk_create(
+            [Product(name='Product %d' % (i // 2)) for i in xrange(5)]
+        )
+        self.qs = Product.objects.all()
+        self.expected = [
+            product.pk for product in self.qs.order_by(*ORDERING)
+        ]
+
+    def pages(self, qs, get_id):
+        ids = []
+        cursor = None
+        while True:
+            page = paginate(qs, ORDERING, cursor, limit=2, secret='secret')
+            self.assertLessEqual(len(page['items']), 2)
+            ids.extend(get_id(item) for item in page['items'])
+            cursor = page['next_cursor']
+            if cursor is None:
+                return ids
+
+    def test_values(self):
+        self.assertEqual(
+            self.pages(self.qs.values('id', 'name'), lambda item: item['id']),
+            self.expected
+        )
+
+    def test_models(self):
+        self.assertEqual(
+            self.pages(self.qs, lambda item: item.pk), self.expected
+        )
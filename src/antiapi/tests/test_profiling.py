@@ -0,0 +1,77 @@
+import os
+from shutil import rmtree
+from tempfile import mkdtemp
+from time import time
+
+from antiapi.method import api_method
+from antiapi.profiling import Profiler
+from antiapi.tests.utils import WerkzeugTestCase
+
+
+class TestProfiler(WerkzeugTestCase):
+    def setUp(self):
+        super(TestProfiler, self).setUp()
+        self.directory = mkdtemp()
+
+    def tearDown(self):
+        super(TestProfiler, self).tearDown()
+        rmtree(self.directory)
+
+    def request_with_token(self, token):
+        return self.request(
+            '/products.json', headers={'X-Api-Profile': token}
+        )
+
+    def test_token(self):
+        profiler = Profiler(self.directory, secret='secret')
+        self.assertFalse(profiler.should_profile(self.request('/p.json')))
+        token = profiler.make_token()
+        self.assertTrue(
+            profiler.should_profile(self.request_with_token(token))
+        )
+        expires, signature = token.split(':')
+        for token in (
+                '%s:%s' % (expires, signature[:-1]),
+                '%d:%s' % (int(expires) + 1, signature),
+                Profiler(self.directory, secret='another').make_token(),
+                profiler.make_token(ttl=-1),
+                'token'):
+            self.assertFalse(
+                profiler.should_profile(self.request_with_token(token))
+            )
+        # Tokens are never valid without secret.
+        profiler = Profiler(self.directory)
+        self.assertFalse(profiler.should_profile(
+            self.request_with_token('%d:' % (time() + 60))
+        ))
+
+    def test_profile(self):
+        profiler = Profiler(self.directory, sample_rate=1, max_total_size=1)
+
+        @api_method('get', 'json', profiler=profiler)
+        def products(request):
+            return [{'id': 1}]
+
+        response = products(self.request('/products.json'))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            len(os.listdir(os.path.join(self.directory, 'products'))), 1
+        )
+        # Size limit of dumps is exceeded.
+        self.assertFalse(profiler.should_profile(self.request('/p.json')))
+        products(self.request('/products.json'))
+        self.assertEqual(
+            len(os.listdir(os.path.join(self.directory, 'products'))), 1
+        )
+        # Size of existing dumps is counted on start.
+        profiler = Profiler(self.directory, sample_rate=1, max_total_size=1)
+        self.assertFalse(profiler.should_profile(self.request('/p.json')))
+
+    def test_shared_directory(self):
+        first = Profiler(self.directory, sample_rate=1, max_total_size=1)
+        second = Profiler(self.directory, sample_rate=1, max_total_size=1)
+        first.profile('products', lambda: None)
+        self.assertTrue(second.should_profile(self.request('/p.json')))
+        # Dumps of other processes are counted by rescanning.
+        second._scanned -= Profiler.RESCAN_INTERVAL
+        self.assertFalse(second.should_profile(self.request('/p.json')))
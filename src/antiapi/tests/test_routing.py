@@ -0,0 +1,74 @@
+from json import loads
+
+from antiapi.method import ApiMethod, api_method
+from antiapi.routing import Registry
+from antiapi.tests.utils import WerkzeugTestCase
+
+
+class Vendors(ApiMethod):
+    content_types = ('json', 'xml')
+
+    def get(self, request, content_type=None):
+        return [{'id': 1}]
+
+    def post(self, request, content_type=None):
+        return {'id': 2}
+
+
+class TestRegistry(WerkzeugTestCase):
+    def setUp(self):
+        super(TestRegistry, self).setUp()
+        from werkzeug.test import Client
+        from werkzeug.wrappers import Response
+
+        api = Registry(prefix='/api')
+
+        @api.route('/products/<int:id>')
+        @api_method('get', ('json', 'xml'))
+        def product(request, id, content_type):
+            return {'id': id, 'content_type': content_type}
+
+        api.add('/vendors', Vendors)
+        self.client = Client(api, Response)
+
+    def test_function(self):
+        response = self.client.get('/api/products/1.json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            loads(response.get_data()), {'id': 1, 'content_type': 'json'}
+        )
+        response = self.client.get('/api/products/1.xml')
+        self.assertEqual(response.headers['Content-Type'], 'application/xml')
+
+    def test_class(self):
+        response = self.client.get('/api/vendors.json')
+        self.assertEqual(loads(response.get_data()), [{'id': 1}])
+        response = self.client.get(
+            '/api/vendors.json', headers={'X-HTTP-Method-Override': 'POST'}
+        )
+        self.assertEqual(loads(response.get_data()), {'id': 2})
+        response = self.client.get(
+            '/api/vendors.json', headers={'X-HTTP-Method-Override': 'PUT'}
+        )
+        self.assertEqual(response.status_code, 405)
+        self.assertEqual(response.headers['Allow'], 'GET, POST')
+
+    def test_errors(self):
+        response = self.client.get('/api/products/a.json')
+        self.assertEqual(response.status_code, 404)
+        self.assertEqual(
+            loads(response.get_data()), {'message': 'Not Found'}
+        )
+        response = self.client.post('/api/products/1.xml')
+        self.assertEqual(response.status_code, 405)
+        self.assertEqual(
+            response.get_data(),
+            '<?xml version="1.0" encoding="utf-8"?><error>'
+            '<message>Method Not Allowed</message></error>'
+        )
+        self.assertEqual(sorted(
+            response.headers['Allow'].split(', ')
+        ), ['GET', 'HEAD'])
+        response = self.client.get('/api/products/1.csv')
+        self.assertEqual(response.status_code, 404)
+        self.assertEqual(response.get_data(), 'Not Found')
@@ -0,0 +1,134 @@
+from array import array
+from unittest import skipIf
+from unittest.case import TestCase
+from uuid import UUID
+
+from antiapi.serializers import Fragment, invalidate_fragment, \
+    select_fields, to_json, to_xml
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+
+class TestFragments(TestCase):
+    def setUp(self):
+        invalidate_fragment('vendor')
+        self.calls = []
+
+    def vendor(self):
+        self.calls.append(1)
+        return {'stuff': [Fragment('category', 'Food')]}
+
+    def test_json(self):
+        data = [{'vendor': Fragment('vendor', self.vendor)}] * 2
+        expected = '[{"vendor": {"stuff": ["Food"]}}, ' \
+            '{"vendor": {"stuff": ["Food"]}}]'
+        self.assertEqual(to_json(data), expected)
+        self.assertEqual(to_json(data), expected)
+        self.assertEqual(len(self.calls), 1)
+        invalidate_fragment('vendor')
+        self.assertEqual(to_json(data), expected)
+        self.assertEqual(len(self.calls), 2)
+
+    def test_json_pretty(self):
+        data = [{'vendor': Fragment('vendor', self.vendor)}] * 2
+        expected = to_json(
+            [{'vendor': {'stuff': ['Food']}}] * 2, is_pretty=True
+        )
+        self.assertEqual(to_json(data, is_pretty=True), expected)
+        # Cached fragments are indented by their place.
+        self.assertEqual(to_json(data, is_pretty=True), expected)
+        self.assertEqual(
+            to_json({'a': {'b': data}}, is_pretty=True),
+            to_json({'a': {'b': [
+                {'vendor': {'stuff': ['Food']}}
+            ] * 2}}, is_pretty=True)
+        )
+        self.assertEqual(len(self.calls), 1)
+
+    def test_xml(self):
+        data = {'vendor': Fragment('vendor', self.vendor)}
+        expected = '<?xml version="1.0" encoding="utf-8"?><root><vendor>' \
+            '<stuff><item>Food</item></stuff></vendor></root>'
+        self.assertEqual(to_xml(data), expected)
+        self.assertEqual(to_xml(data), expected)
+        self.assertEqual(len(self.calls), 1)
+
+
+class TestSelectFields(TestCase):
+    def test(self):
+        data = {'products': [
+            {'id': 1, 'name': 'a', 'vendor': {'id': 2, 'name': 'b'}},
+            {'id': 3, 'name': 'c'},
+        ]}
+        self.assertEqual(
+            select_fields(data, ['products.id', 'products.vendor.name']),
+            {'products': [{'id': 1, 'vendor': {'name': 'b'}}, {'id': 3}]}
+        )
+        self.assertEqual(
+            select_fields(data, ['products.vendor', 'products']), data
+        )
+
+    def test_xml(self):
+        data = {'params': [
+            {'#name': 'param', '@name': 'a', 'text()': '1', 'unit': 'kg'},
+            {'#name': 'param', '@name': 'b', 'text()': '2', 'unit': 'kg'},
+        ]}
+        self.assertEqual(
+            to_xml(data, fields=['params.id']),
+            '<?xml version="1.0" encoding="utf-8"?><root><params>'
+            '<param name="a">1</param><param name="b">2</param>'
+            '</params></root>'
+        )
+
+
+@skipIf(numpy is None, 'NumPy is not installed')
+class TestNumpy(TestCase):
+    def setUp(self):
+        dtype = [('id', 'i8'), ('price', 'f8')]
+        rows = [(1, 2.5), (2, 3.5)]
+        self.arrays = (
+            numpy.array(rows, dtype=dtype), numpy.rec.array(rows, dtype=dtype)
+        )
+
+    def test_json(self):
+        self.assertEqual(
+            to_json({'ids': numpy.arange(3), 'total': numpy.float64(1.5)}),
+            to_json({'ids': [0, 1, 2], 'total': 1.5})
+        )
+        for arr in self.arrays:
+            self.assertEqual(
+                to_json(arr),
+                to_json([{'id': 1, 'price': 2.5}, {'id': 2, 'price': 3.5}])
+            )
+
+    def test_xml(self):
+        for arr in self.arrays:
+            self.assertEqual(
+                to_xml({'products': arr}),
+                to_xml({'products': [
+                    {'id': 1, 'price': 2.5}, {'id': 2, 'price': 3.5}
+                ]})
+            )
+
+
+class TestExtraTypes(TestCase):
+    def test_array(self):
+        self.assertEqual(
+            to_json({'ids': array('l', [1, 2])}), '{"ids": [1, 2]}'
+        )
+        self.assertEqual(to_json(array('d', [1.5])), '[1.5]')
+        self.assertEqual(
+            to_xml({'ids': array('l', [1, 2])}),
+            '<?xml version="1.0" encoding="utf-8"?><root><ids><item>1</item>'
+            '<item>2</item></ids></root>'
+        )
+
+    def test_uuid(self):
+        value = UUID('12345678123456781234567812345678')
+        self.assertEqual(
+            to_json({'id': value}),
+            '{"id": "12345678-1234-5678-1234-567812345678"}'
+        )
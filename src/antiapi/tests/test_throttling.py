@@ -0,0 +1,76 @@
+from unittest.case import TestCase
+
+from antiapi.errors import OverloadError
+from antiapi.method import api_method
+from antiapi.tests.utils import WerkzeugTestCase
+from antiapi.throttling import Limiter, TokenBucket
+
+
+class TestTokenBucket(TestCase):
+    def test(self):
+        bucket = TokenBucket(rate=10, capacity=2)
+        self.assertEqual(bucket.take(), 0)
+        self.assertEqual(bucket.take(), 0)
+        self.assertAlmostEqual(bucket.take(), 0.1, places=2)
+        # Refilled in 0.1 sec.
+        bucket.updated -= 0.1
+        self.assertEqual(bucket.take(), 0)
+
+
+class TestLimiter(TestCase):
+    def test_rate(self):
+        limiter = Limiter(rate=0.5, burst=2, key_func=lambda request: request)
+        handler = limiter(lambda request: 'ok')
+        self.assertEqual(handler('a'), 'ok')
+        self.assertEqual(handler('a'), 'ok')
+        try:
+            handler('a')
+        except OverloadError as e:
+            self.assertEqual(e.retry_after, 2)
+        else:
+            self.fail('OverloadError is not raised')
+        # Every key has its own bucket.
+        self.assertEqual(handler('b'), 'ok')
+
+    def test_fractional_rate(self):
+        limiter = Limiter(rate=0.5)
+        self.assertEqual(limiter.burst, 1)
+        handler = limiter(lambda request: 'ok')
+        self.assertEqual(handler(None), 'ok')
+        self.assertRaises(OverloadError, handler, None)
+        self.assertRaises(AssertionError, Limiter, rate=2, burst=0.5)
+
+    def test_concurrency(self):
+        limiter = Limiter(max_concurrency=1)
+
+        @limiter
+        def handler(request, depth):
+            if depth:
+                return handler(request, depth - 1)
+            return 'ok'
+
+        self.assertEqual(handler(None, 0), 'ok')
+        # Nested call waits for the slot taken by outer one.
+        self.assertRaises(OverloadError, handler, None, 1)
+        # Slot is released after error.
+        self.assertEqual(handler(None, 0), 'ok')
+
+
+class TestApiMethodLimiter(WerkzeugTestCase):
+    def test(self):
+        @api_method('get', 'xml', xml_root_node='products',
+                    limiter=Limiter(rate=1, burst=1),
+                    allowed_fields=('id', ))
+        def products(request):
+            return [{'id': 1, 'name': 'a'}]
+
+        response = products(self.request('/products.xml'))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            response.get_data(),
+            '<?xml version="1.0" encoding="utf-8"?><products><item><id>1</id>'
+            '<name>a</name></item></products>'
+        )
+        response = products(self.request('/products.xml'))
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(response.headers['Retry-After'], '1')
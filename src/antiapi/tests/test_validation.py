@@ -1,4 +1,4 @@
-from datetime import date, datetime
+from datetime import date, datetime, timedelta
 from decimal import Decimal
 from unittest.case import TestCase
 
@@ -212,4 +212,99 @@ class TestValidation(TestCase):
         except ValidationError as e:
             self.assertEqual(e.message, param['errors']['required'])
             self.assertEqual(e.key, param_name)
-            self.assertEqual(e.code, 'required')
\ No newline at end of file
+            self.assertEqual(e.code, 'required')
+
+    def test_many(self):
+        params = {
+            'ids': Param(type='int', many=True, min=1, max=100, max_items=3),
+        }
+        data = validate(params, {'ids': '1, 2,3'})
+        self.assertEqual(data['ids'].typecode, 'l')
+        self.assertEqual(list(data['ids']), [1, 2, 3])
+        self.assertEqual(validate(params, {}), {})
+        for value, code in (('1,a', 'value'), ('1,101', 'limits'),
+                            ('1,2,3,4', 'items')):
+            try:
+                validate(params, {'ids': value})
+            except ValidationError as e:
+                self.assertEqual(e.code, code)
+            else:
+                self.fail('ValidationError is not raised for %s' % value)
+
+    def test_many_repeated_keys(self):
+        class MultiDict(dict):
+            def getlist(self, key):
+                return self.get(key, [])
+
+        params = {
+            'names': Param(type='unicode', many=True, set=('a', 'b', 'c')),
+        }
+        data = validate(params, MultiDict(names=['a', 'b,c']))
+        self.assertEqual(data['names'], ['a', 'b', 'c'])
+        self.assertRaises(
+            ValidationError, validate, params, MultiDict(names=['a', 'd'])
+        )
+
+    def test_datetime(self):
+        params = {'dt': Param(type='datetime')}
+        data = validate(params, {'dt': '2012-06-30T12:42:38.25Z'})
+        self.assertEqual(data['dt'], datetime(2012, 6, 30, 12, 42, 38, 250000))
+        data = validate(params, {'dt': '2012-06-30T12:42+03:00'})
+        self.assertEqual(data['dt'].utcoffset(), timedelta(hours=3))
+        self.assertEqual(
+            data['dt'].replace(tzinfo=None), datetime(2012, 6, 30, 12, 42)
+        )
+        self.assertRaises(
+            ValidationError, validate, params, {'dt': '2012-06-30 12:42'}
+        )
+
+    def test_datetime_limits(self):
+        params = {'dt': Param(
+            type='datetime',
+            min=datetime(2012, 6, 30, 12), max=datetime(2012, 6, 30, 13)
+        )}
+        # Naive limits are compared with values in UTC.
+        data = validate(params, {'dt': '2012-06-30T15:30+03:00'})
+        self.assertEqual(data['dt'].utcoffset(), timedelta(hours=3))
+        for value in ('2012-06-30T12:30+03:00', '2012-06-30T12:30-03:00'):
+            try:
+                validate(params, {'dt': value})
+            except ValidationError as e:
+                self.assertEqual(e.code, 'limits')
+            else:
+                self.fail('ValidationError is not raised for %s' % value)
+        params['dt']['many'] = True
+        data = validate(
+            params, {'dt': '2012-06-30T12:10Z,2012-06-30T14:50+02:00'}
+        )
+        self.assertEqual(len(data['dt']), 2)
+        self.assertRaises(
+            ValidationError, validate, params,
+            {'dt': '2012-06-30T12:10,2012-06-30T15:50+02:00'}
+        )
+
+    def test_collect_errors(self):
+        params = {
+            'p1': {'type': 'int', 'required': True},
+            'p2': {'type': 'int', 'max': 10, 'errors': {'limits': 'GOSHA'}},
+            'p3': {'type': 'int'},
+        }
+        data = {'p2': '11', 'p3': '1'}
+        self.assertRaises(ValidationError, validate, params, data)
+        try:
+            validate(params, data, collect_errors=True)
+        except ValidationError as e:
+            self.assertEqual(e.code, 'multiple')
+            self.assertEqual(e.errors, [
+                {
+                    'key': 'p1',
+                    'code': 'required',
+                    'message': '"p1" parameter is required',
+                },
+                {'key': 'p2', 'code': 'limits', 'message': 'GOSHA'},
+            ])
+        else:
+            self.fail('ValidationError is not raised')
+        self.assertEqual(
+            validate(params, {'p1': '1'}, collect_errors=True), {'p1': 1}
+        )
@@ -0,0 +1,67 @@
+from unittest.case import TestCase
+
+from antiapi import method
+
+try:
+    import django
+except ImportError:
+    django = None
+
+try:
+    from werkzeug.test import EnvironBuilder
+    from werkzeug.wrappers import Request, Response
+except ImportError:
+    Response = None
+
+
+def setup_django():
+    """
+    Configures Django with in-memory SQLite database and local memory cache
+    and creates tables of test models. Returns False if Django isn't
+    installed.
+    """
+    if django is None:
+        return False
+    from django.conf import settings
+
+    if settings.configured:
+        return True
+    settings.configure(
+        DATABASES={'default': {
+            'ENGINE': 'django.db.backends.sqlite3',
+            'NAME': ':memory:',
+        }},
+        CACHES={'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        }},
+        INSTALLED_APPS=['antiapi.tests'],
+        SECRET_KEY='test',
+    )
+    django.setup()
+    from django.apps import apps
+    from django.db import connection
+
+    with connection.schema_editor() as editor:
+        for model in apps.get_app_config('tests').get_models():
+            editor.create_model(model)
+    return True
+
+
+class WerkzeugTestCase(TestCase):
+    """
+    Runs API methods in Werkzeug mode, even if Django is configured by
+    other tests. Skipped if Werkzeug isn't installed.
+    """
+    def setUp(self):
+        if Response is None:
+            self.skipTest('Werkzeug is not installed')
+        self._backend = method._backend
+        method._backend = method.Backend(False, object(), Response, Response)
+
+    def tearDown(self):
+        method._backend = self._backend
+
+    def request(self, url, http_method='GET', **kwargs):
+        return Request(
+            EnvironBuilder(url, method=http_method, **kwargs).get_environ()
+        )
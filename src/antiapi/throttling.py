@@ -0,0 +1,112 @@
+from math import ceil
+from threading import Condition, Lock
+from time import time
+
+from .cache import LocalCache
+from .errors import OverloadError
+
+
+class TokenBucket(object):
+    """
+    Token bucket refilled by "rate" tokens per second up to "capacity".
+    """
+    def __init__(self, rate, capacity):
+        self.rate = float(rate)
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time()
+
+    def take(self):
+        """
+        Takes a token. Returns 0 on success or number of seconds to wait
+        for the next token otherwise.
+        """
+        now = time()
+        self.tokens = min(
+            self.capacity, self.tokens + (now - self.updated) * self.rate
+        )
+        self.updated = now
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return 0
+        return (1 - self.tokens) / self.rate
+
+
+class Limiter(object):
+    """
+    Admission control for API methods. Limits number of concurrently
+    processed requests by "max_concurrency": a request waits for a free
+    slot at most "queue_timeout" seconds and is rejected with HTTP 503
+    then. Optional "rate" (requests per second) and "burst" limits are
+    applied by token buckets kept in process memory per value of
+    "key_func(request)" (e.g. auth key id) or per API method if "key_func"
+    isn't specified. Usage:
+
+        @api_method('get', 'json', limiter=Limiter(max_concurrency=10))
+        def slow_method(request):
+            ...
+
+    or "limiter" attribute of ApiMethod's child class.
+    """
+    def __init__(self, max_concurrency=None, queue_timeout=0, rate=None,
+                 burst=None, key_func=None, retry_after=1,
+                 max_buckets=10000):
+        self.max_concurrency = max_concurrency
+        self.queue_timeout = queue_timeout
+        self.rate = rate
+        # A request takes a whole token, so bucket of rates below 1 must
+        # still hold at least one.
+        self.burst = burst or (max(1, rate) if rate else rate)
+        assert not rate or self.burst >= 1, 'Burst must be at least 1'
+        self.key_func = key_func
+        self.retry_after = retry_after
+        self._active = 0
+        self._slots = Condition(Lock())
+        self._buckets_lock = Lock()
+        if rate:
+            # Idle buckets are full, so it's safe to forget them.
+            self._buckets = LocalCache(
+                max_size=max_buckets, ttl=self.burst / float(rate) + 1
+            )
+
+    def __call__(self, handler):
+        def _handler(request, *args, **kwargs):
+            if self.rate:
+                self._take_token(request)
+            if not self.max_concurrency:
+                return handler(request, *args, **kwargs)
+            self._acquire()
+            try:
+                return handler(request, *args, **kwargs)
+            finally:
+                self._release()
+        return _handler
+
+    def _take_token(self, request):
+        key = self.key_func(request) if self.key_func else None
+        with self._buckets_lock:
+            bucket = self._buckets.get(key)
+            if bucket is None:
+                bucket = TokenBucket(self.rate, self.burst)
+            wait = bucket.take()
+            self._buckets.set(key, bucket)
+        if wait:
+            raise OverloadError('Rate limit exceeded', int(ceil(wait)))
+
+    def _acquire(self):
+        with self._slots:
+            if self._active >= self.max_concurrency:
+                deadline = time() + self.queue_timeout
+                while self._active >= self.max_concurrency:
+                    remaining = deadline - time()
+                    if remaining <= 0:
+                        raise OverloadError(
+                            'Service Unavailable', self.retry_after
+                        )
+                    self._slots.wait(remaining)
+            self._active += 1
+
+    def _release(self):
+        with self._slots:
+            self._active -= 1
+            self._slots.notify()
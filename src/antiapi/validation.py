@@ -1,5 +1,7 @@
-from datetime import date, datetime, timedelta
+from array import array
+from datetime import date, datetime, timedelta, tzinfo
 from decimal import Decimal
+import re
 
 from .errors import ValidationError
 
@@ -12,10 +14,16 @@ class Param(dict):
     of IDEs.
     """
     def __init__(self, type, default=None, required=False, validator=None,
-                 max=None, min=None, process=None, values=None, **kwargs):
+                 max=None, min=None, process=None, values=None, many=False,
+                 separator=',', max_items=None, **kwargs):
         """
         Note that in the body of __init__ a standard pythonic "type", "max"
         and "min" are overriden by keyword arguments.
+        If "many" is true, parameter is a list of values passed separated by
+        "separator" (e.g. "ids=1,2,3") or by repeated keys (e.g.
+        "ids=1&ids=2"). Lists of ints and floats are converted to compact
+        "array.array" (or to NumPy array if "many" is "numpy"), "max" and
+        "min" limits are applied to every item.
         """
         assert type in _types_map, 'Type must be one of %s' % _types_map.keys()
         self['type'] = type
@@ -26,6 +34,9 @@ class Param(dict):
         self['min'] = min
         self['process'] = process
         self['values'] = values
+        self['many'] = many
+        self['separator'] = separator
+        self['max_items'] = max_items
         for k in kwargs:
             self[k] = kwargs[k]
 
@@ -48,53 +59,171 @@ class Param(dict):
 #        return _validate_by_type(self, value)
 
 
-def validate(params, data, error_messages=None):
+def validate(params, data, error_messages=None, collect_errors=False):
     """
     Validates values of API method's parameters got from GET or POST.
     Sets a cleaned values to get_values and post_values properties
     and call a wrapped HTTP method's handler if success or returns
     400 HTTP error otherwise.
+    By default the first invalid parameter raises ValidationError. If
+    "collect_errors" is true, all parameters are checked and ValidationError
+    with list of all errors in "errors" attribute is raised.
     """
     values = {}
+    errors = []
     for name, param in params.iteritems():
-        value = data.get(name, param.get('default'))
-        if not value:
-            if param.get('required'):
-                _validation_error(param, 'required', name, error_messages)
-            elif param.get('default'):
-                # If GET parameter is in the request,
-                # but has an empty value.
-                value = param['default']
+        try:
+            if param.get('many'):
+                _validate_many(values, name, param, data, error_messages)
             else:
-                continue
+                _validate_one(values, name, param, data, error_messages)
+        except ValidationError as e:
+            if not collect_errors:
+                raise
+            errors.append({'key': e.key, 'code': e.code, 'message': e.message})
+    if errors:
+        errors.sort(key=lambda error: error['key'])
+        raise ValidationError(
+            'Request has %d invalid parameters' % len(errors),
+            code='multiple', errors=errors
+        )
+    return values
 
-        try:
-            assert param['type'] in _types_map, \
-                'Type must be one of %s' % _types_map.keys()
-            values[name] = _types_map[param['type']](value)
-            if 'process' in param:
-                values[name] = param['process'](values[name])
-        except (TypeError, ValueError):
-            _type = getattr(param['type'], '__name__', param['type'])
-            _validation_error(param, 'value', name, error_messages, _type)
-        if param.get('process'):
-            values[name] = param['process'](values[name])
-        if param.get('set') and values[name] not in param['set']:
+
+def _validate_one(values, name, param, data, error_messages):
+    """
+    Validates scalar parameter and sets its cleaned value to "values".
+    """
+    value = data.get(name, param.get('default'))
+    if not value:
+        if param.get('required'):
+            _validation_error(param, 'required', name, error_messages)
+        elif param.get('default'):
+            # If GET parameter is in the request,
+            # but has an empty value.
+            value = param['default']
+        else:
+            return
+
+    try:
+        assert param['type'] in _types_map, \
+            'Type must be one of %s' % _types_map.keys()
+        values[name] = _types_map[param['type']](value)
+    except (TypeError, ValueError):
+        _type = getattr(param['type'], '__name__', param['type'])
+        _validation_error(param, 'value', name, error_messages, _type)
+    if param.get('process'):
+        values[name] = param['process'](values[name])
+    if param.get('set') and values[name] not in param['set']:
+        _validation_error(
+            param, 'set', name, error_messages, ', '.join(param['set'])
+        )
+
+    error = _validate_by_type(param, values[name])
+    if error:
+        _validation_error(param, 'limits', name, error_messages, error)
+
+    validator = param.get('validator', None)
+    if validator:
+        error = validator(values[name])
+        if error:
+            _validation_error(param, 'custom', name, error_messages, error)
+
+
+def _validate_many(values, name, param, data, error_messages):
+    """
+    Validates list parameter and sets its cleaned value to "values".
+    """
+    items = _get_items(data, name, param.get('separator', ','))
+    if not items:
+        if param.get('required') and not param.get('default'):
+            _validation_error(param, 'required', name, error_messages)
+        elif param.get('default'):
+            values[name] = param['default']
+        return
+    if param.get('max_items') and len(items) > param['max_items']:
+        _validation_error(
+            param, 'items', name, error_messages, param['max_items']
+        )
+
+    try:
+        value = _to_many(param['type'], param['many'], items)
+    except (TypeError, ValueError, OverflowError):
+        _type = getattr(param['type'], '__name__', param['type'])
+        _validation_error(param, 'value', name, error_messages, _type)
+    if param.get('process'):
+        value = param['process'](value)
+    if param.get('set'):
+        not_allowed = set(value).difference(param['set'])
+        if not_allowed:
             _validation_error(
-                param, 'set', name, error_messages, ', '.join(param['set'])
+                param, 'set', name, error_messages,
+                ', '.join(map(unicode, param['set']))
             )
 
-        error = _validate_by_type(param, values[name])
+    if param.get('max') is not None or param.get('min') is not None:
+        if param['type'] == 'unicode':
+            highest = max(value, key=len)
+            lowest = min(value, key=len)
+        elif param['type'] == 'datetime':
+            highest = max(value, key=_to_naive_utc)
+            lowest = min(value, key=_to_naive_utc)
+        else:
+            highest = max(value)
+            lowest = min(value)
+        error = _validate_by_type(param, highest) or \
+            _validate_by_type(param, lowest)
         if error:
-            _validation_error(param, 'limits', name, error_messages, error)
+            _validation_error(
+                param, 'limits', name, error_messages, 'items ' + error
+            )
 
-        validator = param.get('validator', None)
-        if validator:
-            error = validator(values[name])
-            if error:
-                _validation_error(param, 'custom', name, error_messages, error)
+    validator = param.get('validator', None)
+    if validator:
+        error = validator(value)
+        if error:
+            _validation_error(param, 'custom', name, error_messages, error)
+    values[name] = value
+
+
+def _get_items(data, name, separator):
+    """
+    Returns list of raw items of list parameter from repeated keys of
+    MultiDict/QueryDict and separated values.
+    """
+    if hasattr(data, 'getlist'):
+        raw = data.getlist(name)
+    else:
+        raw = data.get(name)
+        if raw is None:
+            raw = []
+        elif isinstance(raw, basestring) or not hasattr(raw, '__iter__'):
+            raw = [raw]
+    items = []
+    for item in raw:
+        if isinstance(item, basestring):
+            if separator:
+                items.extend(item.split(separator))
+            else:
+                items.append(item)
+        else:
+            items.append(item)
+    return [
+        item for item in items
+        if not isinstance(item, basestring) or item.strip()
+    ]
 
-    return values
+
+def _to_many(type_, many, items):
+    if many == 'numpy' and type_ in _numpy_types:
+        # NumPy is optional and imported on demand only.
+        import numpy
+        # Conversion of strings is vectorized by NumPy.
+        return numpy.array(items).astype(_numpy_types[type_])
+    if type_ in _array_types:
+        # Builtin conversions handle surrounding spaces themselves.
+        return array(_array_types[type_], map(_builtin_types[type_], items))
+    return map(_types_map[type_], items)
 
 
 def strip_wrapper(type_):
@@ -105,12 +234,69 @@ def strip_wrapper(type_):
     return wrapper
 
 
+class FixedOffset(tzinfo):
+    """
+    Fixed offset in minutes east from UTC.
+    """
+    def __init__(self, minutes):
+        self._offset = timedelta(minutes=minutes)
+        self._name = '%+03d:%02d' % divmod(minutes, 60) if minutes >= 0 \
+            else '-%02d:%02d' % divmod(-minutes, 60)
+
+    def utcoffset(self, dt):
+        return self._offset
+
+    def dst(self, dt):
+        return timedelta(0)
+
+    def tzname(self, dt):
+        return self._name
+
+    def __repr__(self):
+        return 'FixedOffset(%s)' % self._name
+
+
+_offsets = {}
+
+_datetime_re = re.compile(
+    r'(\d{4})-(\d{1,2})-(\d{1,2})T(\d{1,2})'
+    r'(?::(\d{1,2})(?::(\d{1,2})(?:\.(\d+))?)?)?'
+    r'(Z|([+-])(\d{2}):?(\d{2}))?$'
+)
+
+
 def _to_datetime(value):
-        dt, tm = value.strip('Z').split('T')
-        return datetime(*(
-            map(int, dt.split('-')) +
-            map(int, tm.split(':'))
-        ))
+    """
+    Parses ISO 8601 datetime with optional fractional seconds and UTC
+    offset. Datetimes without offset (or with "Z") are naive.
+    """
+    match = _datetime_re.match(value)
+    if match is None:
+        raise ValueError('Invalid datetime "%s"' % value)
+    year, month, day, hour, minute, second, fraction, tz, sign, \
+        tz_hours, tz_minutes = match.groups()
+    result = datetime(
+        int(year), int(month), int(day), int(hour), int(minute or 0),
+        int(second or 0), int(fraction[:6].ljust(6, '0')) if fraction else 0
+    )
+    if sign:
+        offset = int(tz_hours) * 60 + int(tz_minutes)
+        if sign == '-':
+            offset = -offset
+        if offset not in _offsets:
+            _offsets[offset] = FixedOffset(offset)
+        result = result.replace(tzinfo=_offsets[offset])
+    return result
+
+
+def _to_naive_utc(value):
+    """
+    Converts aware datetime to naive one in UTC, so it can be compared with
+    naive datetimes which are in UTC as parsed by "_to_datetime".
+    """
+    if isinstance(value, datetime) and value.utcoffset() is not None:
+        return (value - value.utcoffset()).replace(tzinfo=None)
+    return value
 
 
 _types_map = {
@@ -122,6 +308,22 @@ _types_map = {
     'datetime': strip_wrapper(_to_datetime),
 }
 
+# Types converted by builtins and stored in compact arrays in lists.
+_builtin_types = {
+    'int': int,
+    'float': float,
+}
+
+_array_types = {
+    'int': 'l',
+    'float': 'd',
+}
+
+_numpy_types = {
+    'int': 'int64',
+    'float': 'float64',
+}
+
 _types_limit_aliases = {
     'date': {
         'today': date.today,
@@ -135,6 +337,7 @@ _default_errors = {
     'limits': 'Value of "%s" %s',
     'custom': '"%s" parameter has a wrong value (%s)',
     'set': '"%s" parameter has not allowed value (%s)',
+    'items': '"%s" parameter must have not more than %s items',
 }
 
 
@@ -155,36 +358,47 @@ def _validate_by_type(param, value):
     Helper provides value's validation by type.
     Used in Param and validate function.
     """
+    convert = None
     if param['type'] == 'unicode':
         _value = len(value)
         messages = ('shorter', 'longer')
     else:
         _value = value
         messages = ('less', 'greater')
+        if param['type'] == 'datetime':
+            # Aware and naive datetimes can't be compared.
+            convert = _to_naive_utc
+            _value = convert(value)
     if param.get('max') is not None:
-        _max = _get_limit(param, param['max'])
+        _max = _get_limit(param, param['max'], convert)
         if _value > _max:
             return 'must be %s than %s' % (messages[0], str(param['max']))
     if param.get('min') is not None:
-        _min = _get_limit(param, param['min'])
+        _min = _get_limit(param, param['min'], convert)
         if _value < _min:
             return 'must be %s than %s' % (messages[1], str(param['min']))
 
 
-def _get_limit(param, value):
+def _get_limit(param, value, convert=None):
     if param['type'] in _types_limit_aliases and \
             value in _types_limit_aliases[param['type']]:
-        return _types_limit_aliases[param['type']][value]()
+        value = _types_limit_aliases[param['type']][value]()
+    if convert is not None:
+        return convert(value)
     return value
 
 
 class ValidationMixin(object):
     params = None
     error_messages = None
+    # Report all invalid parameters at once instead of the first one.
+    collect_errors = False
 
-    def validate(self, data, params=None, error_messages=None):
+    def validate(self, data, params=None, error_messages=None,
+                 collect_errors=None):
         return validate(
             params or self.params,
             data,
-            error_messages or self.error_messsages
+            error_messages or self.error_messages,
+            self.collect_errors if collect_errors is None else collect_errors
         )
\ No newline at end of file